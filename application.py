@@ -1,22 +1,36 @@
-from flask import Flask, render_template, request, send_file, redirect, url_for, jsonify, flash
+from flask import Flask, render_template, request, send_file, redirect, url_for, jsonify, flash, Response, g
 from flask_mail import Mail, Message
 import os
 from dotenv import load_dotenv
+from werkzeug.utils import secure_filename
 from PIL import Image
-from rembg import remove
 from docx2pdf import convert
 import io
 import base64
 from models_api import db, APIKey, APIUsage
-import sqlite3
 import datetime
+import time
 # from models import db
 from blueprints.auth import bp as auth_bp
-from blueprints.image_to_jpg_api import bp as image_to_jpg_api_bp
 from blueprints.image_convert_api import bp as image_convert_bp
 from blueprints.chatbot_api import bp as chatbot_bp
 from blueprints.chatbot_public_api import bp as public_chatbot_bp
 from blueprints.api_dashboard import bp as api_dashboard_bp
+from blueprints.jobs_api import bp as jobs_bp
+from services.image_pipeline import reduce_image, reduce_options, target_dimensions
+from services.result_store import results as results_store
+from services.process_pool import map_ordered, client_disconnected, BatchCancelled, MAX_IN_FLIGHT
+from services.bg_removal import bg_remover, cutout_png
+from services.bg_cache import cutout_cache
+from services.zip_stream import iter_zip
+from services.api_keys import require_api_key
+from services.usage_log import usage_writer
+from services import usage_rollup, usage_retention, database, migrations
+from services.database import local_connection
+from services.tool_usage import tool_usage, init_usage_db, tool_report, USAGE_DB
+from services.admission import (
+    admit, batch_cost, memory_budget, rejection_headers, AdmissionRejected,
+)
 
 # Load environment variables from .env file
 load_dotenv()
@@ -30,11 +44,9 @@ db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'chatbot_api.
 # Secret Key Configuration (required for sessions and flash messages)
 application.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
 
-# Database Configuration (using absolute path)
-application.config['SQLALCHEMY_DATABASE_URI'] = os.getenv(
-    'DATABASE_URL', 
-    f'sqlite:///{db_path}'
-)
+# Database Configuration (using absolute path; DATABASE_URL overrides,
+# see services/database.py for pragmas and pool options)
+database.init_app(application, f'sqlite:///{db_path}')
 application.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 application.config['UPLOAD_FOLDER'] = '/tmp/uploads/'  # Safer in EB
@@ -43,6 +55,27 @@ os.makedirs(application.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # Initialize Database
 db.init_app(application)
+usage_writer.init_app(application)
+usage_rollup.register_cli(application)
+usage_retention.register_cli(application)
+
+
+def init_databases():
+    """
+    Create missing tables, apply schema migrations and note when usage
+    rollups went live. Runs once at start-up (gunicorn's when_ready,
+    `flask db-migrate`, the dev server), never on import, so importing the
+    app (tests, CLI commands, scripts) leaves the database files alone.
+    """
+    with application.app_context():
+        db.create_all()
+        applied = migrations.migrate(db.engine)
+        usage_rollup.start(db.engine)
+    init_usage_db()
+    return applied
+
+
+migrations.register_cli(application, init=init_databases)
 
 # Flask-Mail Configuration for Gmail
 application.config['MAIL_SERVER'] = 'smtp.gmail.com'
@@ -56,11 +89,11 @@ mail = Mail(application)
 
 # Register blueprints AFTER creating `application`
 application.register_blueprint(auth_bp)
-application.register_blueprint(image_to_jpg_api_bp)
 application.register_blueprint(image_convert_bp)
 application.register_blueprint(chatbot_bp)
 application.register_blueprint(public_chatbot_bp)
 application.register_blueprint(api_dashboard_bp)
+application.register_blueprint(jobs_bp)
 
 # Context processor - make session available in all templates
 @application.context_processor
@@ -68,12 +101,7 @@ def inject_session():
     from flask import session
     return {'session': session}
 
-# Create database tables
-with application.app_context():
-    db.create_all()
-
 # ---------- Usage tracking (lightweight, local-only) ----------
-USAGE_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'usage.db')
 TOOL_PATHS = {
     '/passport-maker', '/word-to-hashtag', '/word-to-pdf', '/excel-to-pdf', '/ppt-to-pdf',
     '/id-card-maker', '/certificate-maker', '/email-templates', '/application-letter',
@@ -85,17 +113,9 @@ TOOL_PATHS = {
     '/json-formatter', '/base64-tool', '/word-counter'
 }
 
-def init_usage_db():
-    conn = sqlite3.connect(USAGE_DB)
-    conn.execute('''CREATE TABLE IF NOT EXISTS tool_usage (
-        path TEXT PRIMARY KEY,
-        count INTEGER DEFAULT 0,
-        last_seen TEXT
-    )''')
-    conn.commit()
-    conn.close()
 
-init_usage_db()
+# POSTs under these prefixes get a processing-time histogram
+TIMED_PREFIXES = ('/api/', '/tool/')
 
 
 @application.before_request
@@ -105,34 +125,61 @@ def track_tool_usage():
         # ignore static and admin endpoints
         if path.startswith('/static') or path.startswith('/admin'):
             return
-        # track only known tool paths (adjustable)
+        # track only known tool paths (adjustable); counted in memory,
+        # written to usage.db in batches by services/tool_usage.py
         if path in TOOL_PATHS:
-            conn = sqlite3.connect(USAGE_DB)
-            cur = conn.cursor()
-            cur.execute('SELECT count FROM tool_usage WHERE path=?', (path,))
-            row = cur.fetchone()
-            now = datetime.datetime.utcnow().isoformat()
-            if row:
-                cur.execute('UPDATE tool_usage SET count = count + 1, last_seen = ? WHERE path = ?', (now, path))
-            else:
-                cur.execute('INSERT INTO tool_usage (path, count, last_seen) VALUES (?, ?, ?)', (path, 1, now))
-            conn.commit()
-            conn.close()
+            tool_usage.hit(path)
+        if request.method == 'POST' and path.startswith(TIMED_PREFIXES):
+            g.tool_started = time.perf_counter()
     except Exception:
         # don't break the app if tracking fails
         pass
 
 
+@application.after_request
+def track_tool_latency(response):
+    started = g.pop('tool_started', None)
+    # SSE streams stay open for the life of a job - not a processing time.
+    # Unmatched URLs (404 probes) have no rule and would each get a row
+    if (started is not None and request.url_rule is not None
+            and response.mimetype != 'text/event-stream'):
+        tool_usage.timing(request.url_rule.rule, time.perf_counter() - started)
+    return response
+
+
 @application.route('/admin/usage')
 def admin_usage():
-    """Return JSON report of top-used tools (local-only endpoint)."""
+    """
+    Return JSON report of top-used tools (local-only endpoint).
+
+    `usage` is the all-time total per path. `tools` covers ?from=..&to=..
+    (YYYY-MM-DD, default the last 7 days): hits plus p50/p95/p99 latency
+    per tool, and a per-day or per-hour series with ?granularity=day|hour.
+    """
     try:
-        conn = sqlite3.connect(USAGE_DB)
-        cur = conn.cursor()
-        cur.execute('SELECT path, count, last_seen FROM tool_usage ORDER BY count DESC')
+        today = datetime.datetime.utcnow().date()
+        start = request.args.get('from') or (today - datetime.timedelta(days=6)).isoformat()
+        end = request.args.get('to') or today.isoformat()
+        granularity = request.args.get('granularity')
+        if granularity not in (None, 'day', 'hour'):
+            return jsonify({'success': False, 'error': 'granularity must be day or hour'}), 400
+        try:
+            datetime.date.fromisoformat(start)
+            datetime.date.fromisoformat(end)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'from/to must be YYYY-MM-DD'}), 400
+
+        # Include this worker's not-yet-flushed counts
+        tool_usage.flush()
+        cur = local_connection(USAGE_DB).execute(
+            'SELECT path, count, last_seen FROM tool_usage ORDER BY count DESC')
         data = [{'path': r[0], 'count': r[1], 'last_seen': r[2]} for r in cur.fetchall()]
-        conn.close()
-        return jsonify({'success': True, 'usage': data})
+        return jsonify({
+            'success': True,
+            'usage': data,
+            'range': {'from': start, 'to': end},
+            'tools': tool_report(start, end, granularity)
+        })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -418,364 +465,57 @@ def reduce_image_size():
     return render_template('reduce_image_size.html')
 
 @application.route('/api/reduce-images', methods=['POST'])
+@require_api_key(optional=True)
 def api_reduce_images():
     try:
         files = request.files.getlist('files[]')
-        width = request.form.get('width', type=int)
-        height = request.form.get('height', type=int)
-        preset_size = request.form.get('preset_size')
-        max_file_size = request.form.get('max_file_size', type=int)  # in KB
-        custom_target_size = request.form.get('custom_target_size', type=float)
-        size_unit = request.form.get('size_unit', 'kb')
+        options = reduce_options(request.form)
+        # inline=1 returns the bytes in the JSON instead of a download URL
+        inline = request.form.get('inline', '').lower() in ('1', 'true', 'yes')
         
         if not files:
             return jsonify({'error': 'No files uploaded'}), 400
         
+        # Decode straight from the upload streams - nothing hits disk here
+        jobs = [(file.stream.read(), file.filename, options) for file in files if file and file.filename]
+        try:
+            # Headers only: reject bombs and wait for memory before decoding
+            infos = [admit(data, plan=lambda img: target_dimensions(img, options)) for data, _, _ in jobs]
+            with memory_budget.reserve(batch_cost(infos, MAX_IN_FLIGHT)):
+                reduced = map_ordered(reduce_image, jobs,
+                                      is_cancelled=lambda: client_disconnected(request.environ))
+        except AdmissionRejected as e:
+            return jsonify({'error': str(e)}), e.status, rejection_headers(e)
+        except BatchCancelled as e:
+            return jsonify({'error': f'Processing stopped: {e}'}), 503
+        
         results = []
         
-        for file in files:
-            if file and file.filename:
-                # Save original file
-                original_filename = file.filename
-                filepath = os.path.join(application.config['UPLOAD_FOLDER'], original_filename)
-                file.save(filepath)
-                
-                # Open and process image
-                img = Image.open(filepath)
-                original_size = os.path.getsize(filepath)
-                
-                # Determine target dimensions
-                if preset_size:
-                    preset_dimensions = {
-                        '1024x768': (1024, 768),
-                        '800x800': (800, 800),
-                        '800x600': (800, 600),
-                        '640x480': (640, 480),
-                        '350x270': (350, 270)
-                    }
-                    target_width, target_height = preset_dimensions.get(preset_size, (800, 800))
-                else:
-                    target_width = width or img.width
-                    target_height = height or img.height
-                
-                # Resize image
-                if img.width != target_width or img.height != target_height:
-                    img = img.resize((target_width, target_height), Image.Resampling.LANCZOS)
-                
-                # Generate output filename
-                name, ext = os.path.splitext(original_filename)
-                output_filename = f"converted_{name}{ext}"
-                output_path = os.path.join(application.config['UPLOAD_FOLDER'], output_filename)
-                
-                # Handle custom target size (force to specific size)
-                if custom_target_size:
-                    # Convert target size to bytes
-                    if size_unit == 'mb':
-                        target_size_bytes = int(custom_target_size * 1024 * 1024)
-                    else:  # kb
-                        target_size_bytes = int(custom_target_size * 1024)
-                    
-                    current_size = os.path.getsize(filepath)
-                    
-                    # Handle different image formats
-                    is_png = ext.lower() == '.png'
-                    is_jpeg = ext.lower() in ['.jpg', '.jpeg']
-                    
-                    if target_size_bytes > current_size:
-                        # INCREASE file size - add padding or reduce compression
-                        if is_png:
-                            # For PNG, reduce compression and add metadata if needed
-                            best_size = 0
-                            best_compress_level = 9
-                            
-                            # Try different compression levels (9=most, 0=least)
-                            for compress_level in range(9, -1, -1):
-                                temp_path = os.path.join(application.config['UPLOAD_FOLDER'], f"temp_expand_{compress_level}_{name}{ext}")
-                                try:
-                                    img.save(temp_path, optimize=False, compress_level=compress_level)
-                                    current_test_size = os.path.getsize(temp_path)
-                                    
-                                    if current_test_size <= target_size_bytes and current_test_size > best_size:
-                                        best_size = current_test_size
-                                        best_compress_level = compress_level
-                                        if os.path.exists(output_path):
-                                            os.remove(output_path)
-                                        os.rename(temp_path, output_path)
-                                    else:
-                                        os.remove(temp_path)
-                                except Exception:
-                                    if os.path.exists(temp_path):
-                                        os.remove(temp_path)
-                            
-                            # If still not big enough, add padding bytes
-                            if os.path.exists(output_path):
-                                current_size = os.path.getsize(output_path)
-                                if current_size < target_size_bytes:
-                                    with open(output_path, 'ab') as f:
-                                        padding_needed = target_size_bytes - current_size
-                                        # Add null bytes as padding
-                                        f.write(b'\x00' * padding_needed)
-                            else:
-                                # Fallback: save without compression and add padding
-                                img.save(output_path, optimize=False, compress_level=0)
-                                current_size = os.path.getsize(output_path)
-                                if current_size < target_size_bytes:
-                                    with open(output_path, 'ab') as f:
-                                        padding_needed = target_size_bytes - current_size
-                                        f.write(b'\x00' * padding_needed)
-                        
-                        elif is_jpeg:
-                            # For JPEG, use lowest quality and add padding
-                            save_img = img.convert('RGB') if img.mode in ('RGBA', 'P') else img
-                            save_img.save(output_path, quality=100, optimize=False)
-                            
-                            current_size = os.path.getsize(output_path)
-                            if current_size < target_size_bytes:
-                                with open(output_path, 'ab') as f:
-                                    padding_needed = target_size_bytes - current_size
-                                    f.write(b'\x00' * padding_needed)
-                        
-                        else:
-                            # For other formats, save with best quality and add padding
-                            img.save(output_path, optimize=False)
-                            current_size = os.path.getsize(output_path)
-                            if current_size < target_size_bytes:
-                                with open(output_path, 'ab') as f:
-                                    padding_needed = target_size_bytes - current_size
-                                    f.write(b'\x00' * padding_needed)
-                    
-                    else:
-                        # DECREASE file size - compress aggressively
-                        if is_png:
-                            # For PNG, try different compression levels and resizing
-                            achieved = False
-                            
-                            # First try compression levels
-                            for compress_level in range(9, -1, -1):
-                                temp_path = os.path.join(application.config['UPLOAD_FOLDER'], f"temp_compress_{compress_level}_{name}{ext}")
-                                try:
-                                    img.save(temp_path, optimize=True, compress_level=compress_level)
-                                    current_test_size = os.path.getsize(temp_path)
-                                    
-                                    if current_test_size <= target_size_bytes:
-                                        if os.path.exists(output_path):
-                                            os.remove(output_path)
-                                        os.rename(temp_path, output_path)
-                                        achieved = True
-                                        break
-                                    else:
-                                        os.remove(temp_path)
-                                except Exception:
-                                    if os.path.exists(temp_path):
-                                        os.remove(temp_path)
-                            
-                            # If compression alone isn't enough, try resizing
-                            if not achieved:
-                                scale_factor = 0.9
-                                while scale_factor > 0.1:
-                                    new_width = max(1, int(img.width * scale_factor))
-                                    new_height = max(1, int(img.height * scale_factor))
-                                    resized_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                                    
-                                    temp_path = os.path.join(application.config['UPLOAD_FOLDER'], f"temp_resize_{int(scale_factor*100)}_{name}{ext}")
-                                    try:
-                                        resized_img.save(temp_path, optimize=True, compress_level=9)
-                                        current_test_size = os.path.getsize(temp_path)
-                                        
-                                        if current_test_size <= target_size_bytes:
-                                            if os.path.exists(output_path):
-                                                os.remove(output_path)
-                                            os.rename(temp_path, output_path)
-                                            achieved = True
-                                            break
-                                        else:
-                                            os.remove(temp_path)
-                                            scale_factor -= 0.1
-                                    except Exception:
-                                        if os.path.exists(temp_path):
-                                            os.remove(temp_path)
-                                        scale_factor -= 0.1
-                            
-                            # Final fallback for PNG
-                            if not achieved:
-                                img.save(output_path, optimize=True, compress_level=9)
-                        
-                        elif is_jpeg:
-                            # For JPEG, use binary search with quality and resizing
-                            achieved = False
-                            save_img = img.convert('RGB') if img.mode in ('RGBA', 'P') else img
-                            
-                            # First try quality reduction
-                            for quality in range(1, 101):
-                                temp_path = os.path.join(application.config['UPLOAD_FOLDER'], f"temp_quality_{quality}_{name}{ext}")
-                                try:
-                                    save_img.save(temp_path, quality=quality, optimize=True)
-                                    current_test_size = os.path.getsize(temp_path)
-                                    
-                                    if current_test_size <= target_size_bytes:
-                                        if os.path.exists(output_path):
-                                            os.remove(output_path)
-                                        os.rename(temp_path, output_path)
-                                        achieved = True
-                                        break
-                                    else:
-                                        os.remove(temp_path)
-                                except Exception:
-                                    if os.path.exists(temp_path):
-                                        os.remove(temp_path)
-                            
-                            # If quality reduction isn't enough, try resizing
-                            if not achieved:
-                                scale_factor = 0.9
-                                while scale_factor > 0.1:
-                                    new_width = max(1, int(save_img.width * scale_factor))
-                                    new_height = max(1, int(save_img.height * scale_factor))
-                                    resized_img = save_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                                    
-                                    temp_path = os.path.join(application.config['UPLOAD_FOLDER'], f"temp_resize_{int(scale_factor*100)}_{name}{ext}")
-                                    try:
-                                        resized_img.save(temp_path, quality=1, optimize=True)
-                                        current_test_size = os.path.getsize(temp_path)
-                                        
-                                        if current_test_size <= target_size_bytes:
-                                            if os.path.exists(output_path):
-                                                os.remove(output_path)
-                                            os.rename(temp_path, output_path)
-                                            achieved = True
-                                            break
-                                        else:
-                                            os.remove(temp_path)
-                                            scale_factor -= 0.1
-                                    except Exception:
-                                        if os.path.exists(temp_path):
-                                            os.remove(temp_path)
-                                        scale_factor -= 0.1
-                            
-                            # Final fallback for JPEG
-                            if not achieved:
-                                save_img.save(output_path, quality=1, optimize=True)
-                        
-                        else:
-                            # For other formats, try quality reduction and resizing
-                            achieved = False
-                            
-                            # Try quality if supported
-                            for quality in range(1, 101):
-                                temp_path = os.path.join(application.config['UPLOAD_FOLDER'], f"temp_other_{quality}_{name}{ext}")
-                                try:
-                                    img.save(temp_path, quality=quality, optimize=True)
-                                    current_test_size = os.path.getsize(temp_path)
-                                    
-                                    if current_test_size <= target_size_bytes:
-                                        if os.path.exists(output_path):
-                                            os.remove(output_path)
-                                        os.rename(temp_path, output_path)
-                                        achieved = True
-                                        break
-                                    else:
-                                        os.remove(temp_path)
-                                except Exception:
-                                    if os.path.exists(temp_path):
-                                        os.remove(temp_path)
-                                    # Quality not supported, break and try resizing
-                                    break
-                            
-                            # Try resizing if quality didn't work
-                            if not achieved:
-                                scale_factor = 0.9
-                                while scale_factor > 0.1:
-                                    new_width = max(1, int(img.width * scale_factor))
-                                    new_height = max(1, int(img.height * scale_factor))
-                                    resized_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                                    
-                                    temp_path = os.path.join(application.config['UPLOAD_FOLDER'], f"temp_resize_other_{int(scale_factor*100)}_{name}{ext}")
-                                    try:
-                                        resized_img.save(temp_path, optimize=True)
-                                        current_test_size = os.path.getsize(temp_path)
-                                        
-                                        if current_test_size <= target_size_bytes:
-                                            if os.path.exists(output_path):
-                                                os.remove(output_path)
-                                            os.rename(temp_path, output_path)
-                                            achieved = True
-                                            break
-                                        else:
-                                            os.remove(temp_path)
-                                            scale_factor -= 0.1
-                                    except Exception:
-                                        if os.path.exists(temp_path):
-                                            os.remove(temp_path)
-                                        scale_factor -= 0.1
-                            
-                            # Final fallback
-                            if not achieved:
-                                img.save(output_path, optimize=True)
-                
-                # Handle max file size constraint (original logic)
-                elif max_file_size:
-                    target_max_bytes = max_file_size * 1024
-                    is_png = ext.lower() == '.png'
-                    is_jpeg = ext.lower() in ['.jpg', '.jpeg']
-                    
-                    if is_png:
-                        # For PNG, try compression levels
-                        for compress_level in range(9, -1, -1):  # Start with highest compression
-                            img.save(output_path, optimize=True, compress_level=compress_level)
-                            if os.path.getsize(output_path) <= target_max_bytes:
-                                break
-                    else:
-                        # For JPEG and other quality-supporting formats
-                        quality = 95
-                        while quality > 10:
-                            try:
-                                if is_jpeg:
-                                    save_img = img.convert('RGB') if img.mode in ('RGBA', 'P') else img
-                                    save_img.save(output_path, quality=quality, optimize=True)
-                                else:
-                                    img.save(output_path, quality=quality, optimize=True)
-                                
-                                if os.path.getsize(output_path) <= target_max_bytes:
-                                    break
-                                quality -= 5
-                            except Exception:
-                                # Fallback without quality
-                                img.save(output_path, optimize=True)
-                                break
-                else:
-                    # No size constraints - save with best quality
-                    is_jpeg = ext.lower() in ['.jpg', '.jpeg']
-                    try:
-                        if is_jpeg:
-                            save_img = img.convert('RGB') if img.mode in ('RGBA', 'P') else img
-                            save_img.save(output_path, quality=95, optimize=True)
-                        else:
-                            img.save(output_path, optimize=True)
-                    except Exception:
-                        # Final fallback
-                        img.save(output_path)
-                
-                # Get final file info
-                final_size = os.path.getsize(output_path)
-                final_img = Image.open(output_path)
-                
-                results.append({
-                    'original_filename': original_filename,
-                    'output_filename': output_filename,
-                    'original_size': original_size,
-                    'final_size': final_size,
-                    'original_dimensions': f"{img.width}x{img.height}" if 'img' in locals() else "N/A",
-                    'final_dimensions': f"{final_img.width}x{final_img.height}",
-                    'download_url': f'/download/{output_filename}'
-                })
-                
-                # Clean up original file
-                os.remove(filepath)
+        for result in reduced:
+            output = result.pop('data')
+            mime = result.pop('mime')
+            
+            if inline:
+                result['data_url'] = f"data:{mime};base64,{base64.b64encode(output).decode('utf-8')}"
+            else:
+                # Persisted once so any worker can serve the download
+                result_id = results_store.put(output, result['output_filename'], mime=mime, persist=True)
+                result['download_url'] = url_for('download_result', result_id=result_id,
+                                                 filename=result['output_filename'])
+            results.append(result)
         
         return jsonify({'results': results})
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@application.route('/download/<result_id>/<filename>')
+def download_result(result_id, filename):
+    data = results_store.get(result_id)
+    if data is None:
+        return "File not found", 404
+    return send_file(io.BytesIO(data), as_attachment=True, download_name=filename)
+
 @application.route('/download/<filename>')
 def download_file(filename):
     filepath = os.path.join(application.config['UPLOAD_FOLDER'], filename)
@@ -783,32 +523,49 @@ def download_file(filename):
         return send_file(filepath, as_attachment=True)
     return "File not found", 404
 
+def _stored_members(members):
+    """(name, bytes) for each still-stored result; one that expires between
+    the up-front check and its turn in the stream is left out rather than
+    breaking the archive halfway"""
+    for result_id, name in members:
+        data = results_store.get(result_id)
+        if data is not None:
+            yield name, data
+
+
 @application.route('/api/download-all')
 def download_all():
-    import zipfile
-    import tempfile
-    
+    """Stream a ZIP of reduce-images results.
+
+    `?file=<result_id>/<filename>` (repeatable) picks results from the result
+    store; without it, the legacy reduced_* files in UPLOAD_FOLDER are used.
+    """
     try:
-        # Get all reduced files
-        reduced_files = [f for f in os.listdir(application.config['UPLOAD_FOLDER']) if f.startswith('reduced_')]
+        requested = request.args.getlist('file')
+        if requested:
+            members = []
+            for item in requested:
+                result_id, _, filename = item.partition('/')
+                if not results_store.contains(result_id):
+                    return jsonify({'success': False, 'error': 'Some files have expired, please process them again'}), 410
+                members.append((result_id, secure_filename(filename) or f'{result_id}.bin'))
+            stream = iter_zip(_stored_members(members))
+        else:
+            # Get all reduced files
+            reduced_files = [f for f in os.listdir(application.config['UPLOAD_FOLDER']) if f.startswith('reduced_')]
+            
+            if not reduced_files:
+                return jsonify({'success': False, 'error': 'No files to download'}), 404
+            
+            stream = iter_zip((filename, os.path.join(application.config['UPLOAD_FOLDER'], filename))
+                              for filename in reduced_files)
         
-        if not reduced_files:
-            return "No files to download", 404
-        
-        # Create a temporary zip file
-        temp_zip = tempfile.NamedTemporaryFile(delete=False, suffix='.zip')
-        
-        with zipfile.ZipFile(temp_zip, 'w') as zipf:
-            for filename in reduced_files:
-                filepath = os.path.join(application.config['UPLOAD_FOLDER'], filename)
-                if os.path.exists(filepath):
-                    zipf.write(filepath, filename)
-        
-        temp_zip.close()
-        return send_file(temp_zip.name, as_attachment=True, download_name='reduced_images.zip')
+        return Response(stream, mimetype='application/zip', headers={
+            'Content-Disposition': 'attachment; filename=reduced_images.zip'
+        })
     
     except Exception as e:
-        return f"Error creating zip: {str(e)}", 500
+        return jsonify({'success': False, 'error': f'Error creating zip: {str(e)}'}), 500
 
 @application.route('/tool/image-to-jpg', methods=['GET', 'POST'])
 def image_to_jpg():
@@ -852,24 +609,15 @@ def background_remove():
                 return jsonify({'error': 'Empty file'}), 400
 
             print("Processing image with rembg...")
-            input_img = Image.open(io.BytesIO(file_bytes)).convert("RGBA")
-            print("Input image mode:", input_img.mode, "Size:", input_img.size)
-
-            output_img = remove(input_img)
-            print("Output image mode:", output_img.mode, "Size:", output_img.size)
+            with memory_budget.reserve(admit(file_bytes)['cost']):
+                input_img = Image.open(io.BytesIO(file_bytes)).convert("RGBA")
+                print("Input image mode:", input_img.mode, "Size:", input_img.size)
 
-            # Save for debugging
-            debug_path = os.path.join(application.config['UPLOAD_FOLDER'], 'debug_output.png')
-            output_img.save(debug_path, format='PNG')
-            print(f"Saved debug image to {debug_path}")
+                processed_bytes = cutout_png(file_bytes, input_img)
 
-            buf = io.BytesIO()
-            output_img.save(buf, format='PNG')
-            processed_bytes = buf.getvalue()
-
-            original_buf = io.BytesIO()
-            input_img.save(original_buf, format='PNG')
-            original_bytes = original_buf.getvalue()
+                original_buf = io.BytesIO()
+                input_img.save(original_buf, format='PNG')
+                original_bytes = original_buf.getvalue()
 
             original_base64 = base64.b64encode(original_bytes).decode('utf-8')
             processed_base64 = base64.b64encode(processed_bytes).decode('utf-8')
@@ -880,6 +628,8 @@ def background_remove():
                 'processed': f'data:image/png;base64,{processed_base64}'
             })
 
+        except AdmissionRejected as e:
+            return jsonify({'error': str(e)}), e.status, rejection_headers(e)
         except Exception as e:
             print("Background removal error:", str(e))
             return jsonify({'error': str(e)}), 500
@@ -893,6 +643,7 @@ def merge_images():
 
 
 @application.route('/api/merge-remove', methods=['POST'])
+@require_api_key(optional=True)
 def api_merge_remove():
     """Remove background from uploaded image and return base64"""
     file = request.files.get('file')
@@ -900,16 +651,31 @@ def api_merge_remove():
         return jsonify({'error': 'No file provided'}), 400
 
     try:
-        img = Image.open(file.stream).convert("RGBA")
-        output_img = remove(img)
-
-        buf = io.BytesIO()
-        output_img.save(buf, format="PNG")
-        processed_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
+        file_bytes = file.stream.read()
+        with memory_budget.reserve(admit(file_bytes)['cost']):
+            processed_base64 = base64.b64encode(cutout_png(file_bytes)).decode('utf-8')
 
         return jsonify({'processed': f"data:image/png;base64,{processed_base64}"})
+    except AdmissionRejected as e:
+        return jsonify({'error': str(e)}), e.status, rejection_headers(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+
+@application.route('/api/background-remove/cache-stats')
+def background_remove_cache_stats():
+    """Hit/miss counters for this worker's cut-out cache"""
+    return jsonify({'success': True, 'cache': cutout_cache.stats()})
+
+
+@application.route('/api/background-remove/health')
+def background_remove_health():
+    """Model status and latency for this worker; ?probe=1 runs a tiny inference"""
+    try:
+        probe = request.args.get('probe', '').lower() in ('1', 'true', 'yes')
+        return jsonify({'success': True, 'status': bg_remover.health(probe=probe)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
     
 
 # --------- SEO Files ---------
@@ -946,4 +712,5 @@ def bing_verification():
 
 # ----------------- Run -----------------
 if __name__ == '__main__':
+    init_databases()
     application.run(debug=True)
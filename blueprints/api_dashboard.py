@@ -8,6 +8,8 @@ from datetime import datetime, timedelta
 from functools import wraps
 import os
 import secrets
+from services.api_keys import key_resolver
+from services.usage_stats import period_stats, model_usage, bulk_usage_stats
 
 bp = Blueprint('api_dashboard', __name__, url_prefix='/api-service')
 
@@ -56,13 +58,10 @@ def dashboard():
     # এই email এর সব keys fetch করো
     api_keys = APIKey.query.filter_by(email=email).all()
     
-    total_requests = 0
-    total_errors = 0
-    
-    for key in api_keys:
-        stats = key.get_usage_stats(hours=24)
-        total_requests += stats['total_requests']
-        total_errors += stats['failed']
+    # সব keys এর 24h stats একটা query তে
+    stats = bulk_usage_stats([key.id for key in api_keys], hours=24)
+    total_requests = sum(s['total_requests'] for s in stats.values())
+    total_errors = sum(s['failed'] for s in stats.values())
     
     return render_template('api_dashboard_user.html', 
                          api_keys=api_keys,
@@ -120,11 +119,11 @@ def list_keys():
     email = session.get('api_user_email')
     api_keys = APIKey.query.filter_by(email=email).all()
     
+    stats = bulk_usage_stats([key.id for key in api_keys], hours=24)
     keys_data = []
     for key in api_keys:
-        stats = key.get_usage_stats(hours=24)
         key_info = key.to_dict()
-        key_info['usage_24h'] = stats
+        key_info['usage_24h'] = stats[key.id]
         keys_data.append(key_info)
     
     return jsonify({'success': True, 'keys': keys_data}), 200
@@ -160,24 +159,16 @@ def get_key_stats(key_id):
     if not api_key:
         return jsonify({'success': False, 'error': 'Key not found'}), 404
     
-    # Different time periods
-    periods = {
-        '24h': api_key.get_usage_stats(hours=24),
-        '7d': api_key.get_usage_stats(hours=168),
-        '30d': api_key.get_usage_stats(hours=720)
-    }
+    # Different time periods (24h/7d/30d) - one grouped query
+    periods = period_stats(key_id)
     
     # Model usage breakdown
-    logs = APIUsage.query.filter_by(api_key_id=key_id).all()
-    model_usage = {}
-    for log in logs:
-        if log.model_used:
-            model_usage[log.model_used] = model_usage.get(log.model_used, 0) + 1
+    models = model_usage(key_id)
     
     return jsonify({
         'success': True,
         'stats': periods,
-        'model_usage': model_usage,
+        'model_usage': models,
         'last_used': api_key.last_used.isoformat() if api_key.last_used else None
     }), 200
 
@@ -193,6 +184,7 @@ def deactivate_key(key_id):
     
     api_key.is_active = False
     db.session.commit()
+    key_resolver.invalidate(api_key.key_hash)
     
     return jsonify({'success': True, 'message': 'Key deactivated'}), 200
 
@@ -206,8 +198,10 @@ def delete_key(key_id):
     if not api_key:
         return jsonify({'success': False, 'error': 'Key not found'}), 404
     
+    key_hash = api_key.key_hash
     db.session.delete(api_key)
     db.session.commit()
+    key_resolver.invalidate(key_hash)
     
     return jsonify({'success': True, 'message': 'Key deleted'}), 200
 
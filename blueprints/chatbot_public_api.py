@@ -2,10 +2,11 @@
 Public Chatbot API - Simple version without database tracking for now
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, g
 import requests
 import os
 from datetime import datetime
+from services.api_keys import require_api_key
 
 bp = Blueprint('public_chatbot', __name__, url_prefix='/api/public-chatbot')
 
@@ -25,16 +26,13 @@ KNOWLEDGE_BASE = {
 SYSTEM_PROMPT = """You are a helpful assistant for CutCompress, an online image processing tool."""
 
 @bp.route('/ask', methods=['POST'])
+@require_api_key()
 def ask_public():
-    """Public API endpoint"""
+    """Public API endpoint (key checked and rate limited by require_api_key)"""
     try:
         data = request.get_json()
-        api_key = data.get('api_key', '').strip()
         user_message = data.get('message', '').strip()
         
-        if not api_key:
-            return jsonify({'success': False, 'error': 'API key required'}), 401
-        
         if not user_message:
             return jsonify({'success': False, 'error': 'Message required'}), 400
         
@@ -51,6 +49,7 @@ def ask_public():
             model_used = 'fallback'
         
         processing_time = (datetime.utcnow() - start_time).total_seconds()
+        g.usage_extra = {'model_used': model_used, 'message': user_message}
         
         return jsonify({
             'success': True,
@@ -1,6 +1,16 @@
-from flask import Blueprint, request, jsonify
-from PIL import Image
-import io, base64, zipfile
+from flask import Blueprint, request, jsonify, Response, url_for
+import io, base64
+from services.result_store import results as results_store
+from services.zip_stream import iter_zip
+from services.convert_engine import (
+    convert_bytes, convert_named, merge_to_pdf, normalize_format, MIME_EXTENSIONS,
+)
+from services.api_keys import require_api_key
+from services.process_pool import map_ordered, client_disconnected, BatchCancelled, MAX_IN_FLIGHT
+from services.decode_planner import fit_within
+from services.admission import (
+    admit, batch_cost, memory_budget, rejection_headers, AdmissionRejected, ADMISSION_DOWNSCALE,
+)
 
 bp = Blueprint('image_convert_api', __name__)
 
@@ -10,108 +20,218 @@ def to_b64(data: bytes) -> str:
 def decode_data_url(url: str) -> bytes:
     return base64.b64decode(url.split(',', 1)[1])
 
-def convert_image(file_storage, fmt: str, quality: int = 95):
-    img = Image.open(file_storage.stream)
-    size_px = (img.width, img.height)
-    buf = io.BytesIO()
-    if fmt.lower() == 'jpeg':
-        img = img.convert('RGB')
-        img.save(buf, format='JPEG', quality=quality, optimize=True)
-        mime = 'image/jpeg'
-    elif fmt.lower() == 'png':
-        img.save(buf, format='PNG', optimize=True)
-        mime = 'image/png'
-    elif fmt.lower() == 'webp':
-        img.save(buf, format='WEBP', quality=quality, method=6)
-        mime = 'image/webp'
-    elif fmt.lower() == 'pdf':
-        img = img.convert('RGB')
-        img.save(buf, format='PDF', resolution=300.0)
-        mime = 'application/pdf'
-    else:
-        raise ValueError('Unsupported format')
-    buf.seek(0)
-    data = buf.read()
+def convert_options():
+    """quality / max_width / max_height form fields (all optional)"""
     return {
-        'mime': mime,
-        'pixels': f'{size_px[0]}x{size_px[1]}',
-        'size': len(data),
-        'data_url': f'data:{mime};base64,{to_b64(data)}'
+        'quality': request.form.get('quality', type=int),
+        'max_width': request.form.get('max_width', type=int),
+        'max_height': request.form.get('max_height', type=int),
     }
 
-def zip_data_urls(urls, zip_name='converted.zip'):
-    zb = io.BytesIO()
-    with zipfile.ZipFile(zb, 'w', zipfile.ZIP_DEFLATED) as z:
-        for i, u in enumerate(urls, 1):
-            if u.startswith('data:image/jpeg'): ext = 'jpg'
-            elif u.startswith('data:image/png'): ext = 'png'
-            elif u.startswith('data:image/webp'): ext = 'webp'
-            elif u.startswith('data:application/pdf'): ext = 'pdf'
-            else: ext = 'bin'
-            z.writestr(f'file_{i}.{ext}', decode_data_url(u))
-    zb.seek(0)
-    return zb.getvalue()
+def convert_image(file_storage, fmt: str, options=None):
+    return convert_bytes(file_storage.stream.read(), fmt, options)
 
-@bp.route('/api/image-to-jpg', methods=['POST'])
-def api_to_jpg():
+def admit_upload(data: bytes, options: dict):
+    """Header-only admission for one conversion. Oversized JPEGs get their
+    max_width/max_height tightened when ADMISSION_DOWNSCALE is on."""
+    plan = lambda img: fit_within(img.size, options.get('max_width'), options.get('max_height'))
+    info = admit(data, plan=plan, downscale=ADMISSION_DOWNSCALE)
+    if info['limit']:
+        options = dict(options, max_width=info['limit'][0], max_height=info['limit'][1])
+    return info, options
+
+def rejected(e: AdmissionRejected):
+    return jsonify({'success': False, 'error': str(e)}), e.status, rejection_headers(e)
+
+def wants_binary(mime: str) -> bool:
+    """Raw bytes instead of base64 JSON: ?binary=1, or an Accept header
+    that prefers the output type (or octet-stream) over JSON"""
+    if request.args.get('binary', '').lower() in ('1', 'true', 'yes'):
+        return True
+    best = request.accept_mimetypes.best_match(['application/json', mime, 'application/octet-stream'])
+    return best is not None and best != 'application/json'
+
+def converted_response(out):
+    """Binary response (metadata in headers) or the legacy data-URL JSON.
+    The output is also registered in the result store so the ZIP endpoints
+    can take its id instead of the data URL. Only JSON callers (the pages
+    that zip their results later, possibly via another worker) get a disk
+    copy; binary responses stay in this worker's memory tier."""
+    ext = MIME_EXTENSIONS.get(out['mime'], 'bin')
+    binary = wants_binary(out['mime'])
+    result_id = results_store.put(out['data'], f'converted.{ext}', mime=out['mime'],
+                                  persist=not binary)
+    if binary:
+        return Response(out['data'], mimetype=out['mime'], headers={
+            'Content-Length': str(out['size']),
+            'Content-Disposition': f'inline; filename=converted.{ext}',
+            'X-Image-Pixels': out['pixels'],
+            'X-Image-Size': str(out['size']),
+            'X-Result-Id': result_id,
+        })
+    return jsonify({
+        'id': result_id,
+        'url': f"data:{out['mime']};base64,{to_b64(out['data'])}",
+        'pixels': out['pixels'],
+        'size': out['size']
+    })
+
+def data_url_ext(u: str) -> str:
+    if u.startswith('data:image/jpeg'): return 'jpg'
+    elif u.startswith('data:image/png'): return 'png'
+    elif u.startswith('data:image/webp'): return 'webp'
+    elif u.startswith('data:application/pdf'): return 'pdf'
+    return 'bin'
+
+def zip_data_urls(urls):
+    # Decoded one at a time, as the archive streams out
+    return iter_zip((f'file_{i}.{data_url_ext(u)}', decode_data_url(u))
+                    for i, u in enumerate(urls, 1))
+
+def zip_stored_results(ids, ext: str):
+    def members():
+        for i, result_id in enumerate(ids, 1):
+            data = results_store.get(result_id)
+            if data is not None:  # expired mid-stream
+                yield f'file_{i}.{ext}', data
+    return iter_zip(members())
+
+def zip_response(ext: str, download_name: str):
+    """Streamed ZIP of stored results (`ids`), or of posted data URLs (`files`, legacy)"""
+    body = request.get_json(silent=True) or {}
+    ids = body.get('ids')
+    if ids:
+        missing = [result_id for result_id in ids if not results_store.contains(result_id)]
+        if missing:
+            return jsonify({'error': 'Some results have expired, please convert again',
+                            'missing': missing}), 410
+        stream = zip_stored_results(ids, ext)
+    else:
+        stream = zip_data_urls(body.get('files', []))
+    return Response(stream, mimetype='application/zip', headers={
+        'Content-Disposition': f'attachment; filename={download_name}'
+    })
+
+def single_conversion(fmt: str):
     f = request.files.get('file')
     if not f: return jsonify({'error':'no file'}), 400
-    out = convert_image(f, 'jpeg', quality=92)
-    return jsonify({'url': out['data_url'], 'pixels': out['pixels'], 'size': out['size']})
+    data = f.stream.read()
+    try:
+        info, options = admit_upload(data, convert_options())
+        with memory_budget.reserve(info['cost']):
+            out = convert_bytes(data, fmt, options)
+    except AdmissionRejected as e:
+        return rejected(e)
+    return converted_response(out)
+
+@bp.route('/api/image-to-jpg', methods=['POST'])
+@require_api_key(optional=True)
+def api_to_jpg():
+    return single_conversion('jpeg')
 
 @bp.route('/api/image-to-png', methods=['POST'])
+@require_api_key(optional=True)
 def api_to_png():
-    f = request.files.get('file')
-    if not f: return jsonify({'error':'no file'}), 400
-    out = convert_image(f, 'png')
-    return jsonify({'url': out['data_url'], 'pixels': out['pixels'], 'size': out['size']})
+    return single_conversion('png')
 
 @bp.route('/api/image-to-webp', methods=['POST'])
+@require_api_key(optional=True)
 def api_to_webp():
-    f = request.files.get('file')
-    if not f: return jsonify({'error':'no file'}), 400
-    out = convert_image(f, 'webp', quality=90)
-    return jsonify({'url': out['data_url'], 'pixels': out['pixels'], 'size': out['size']})
+    return single_conversion('webp')
+
+@bp.route('/api/image-to-avif', methods=['POST'])
+@require_api_key(optional=True)
+def api_to_avif():
+    return single_conversion('avif')
 
 @bp.route('/api/image-to-pdf', methods=['POST'])
+@require_api_key(optional=True)
 def api_to_pdf():
-    f = request.files.get('file')
-    if not f: return jsonify({'error':'no file'}), 400
-    out = convert_image(f, 'pdf')
-    return jsonify({'url': out['data_url'], 'pixels': out['pixels'], 'size': out['size']})
+    return single_conversion('pdf')
+
+def batch_entry(out, inline: bool):
+    if 'error' in out:
+        return {'name': out['name'], 'error': out['error']}
+    result_id = results_store.put(out['data'], out['name'], mime=out['mime'], persist=True)
+    entry = {
+        'name': out['name'],
+        'id': result_id,
+        'mime': out['mime'],
+        'pixels': out['pixels'],
+        'size': out['size'],
+        'download_url': url_for('download_result', result_id=result_id, filename=out['name'])
+    }
+    if 'pages' in out:
+        entry['pages'] = out['pages']
+    if inline:
+        entry['url'] = f"data:{out['mime']};base64,{to_b64(out['data'])}"
+    return entry
+
+@bp.route('/api/convert', methods=['POST'])
+@require_api_key(optional=True)
+def api_convert_batch():
+    """
+    Convert N files to one format in a single request.
+    Form: files[], format (jpg/png/webp/avif/pdf), quality, max_width,
+    max_height (optional), merge=1 (pdf: one multi-page PDF), inline=1 (include data URLs)
+    """
+    files = [f for f in request.files.getlist('files[]') if f and f.filename]
+    if not files:
+        return jsonify({'success': False, 'error': 'No files uploaded'}), 400
+    try:
+        fmt = normalize_format(request.form.get('format'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    options = convert_options()
+    inline = request.form.get('inline', '').lower() in ('1', 'true', 'yes')
+    merge = request.form.get('merge', '').lower() in ('1', 'true', 'yes')
+
+    try:
+        uploads = [f.stream.read() for f in files]
+        admitted = [admit_upload(data, options) for data in uploads]
+        infos = [info for info, _ in admitted]
+        if fmt == 'pdf' and merge:
+            # Every page is held until the PDF is written
+            with memory_budget.reserve(batch_cost(infos)):
+                out = merge_to_pdf(uploads, options, [opts for _, opts in admitted])
+            out['name'] = 'merged.pdf'
+            outputs = [out]
+        else:
+            jobs = [(data, f.filename, fmt, opts)
+                    for data, f, (_, opts) in zip(uploads, files, admitted)]
+            with memory_budget.reserve(batch_cost(infos, MAX_IN_FLIGHT)):
+                outputs = map_ordered(convert_named, jobs,
+                                      is_cancelled=lambda: client_disconnected(request.environ))
+    except AdmissionRejected as e:
+        return rejected(e)
+    except BatchCancelled as e:
+        return jsonify({'success': False, 'error': f'Processing stopped: {e}'}), 503
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    return jsonify({
+        'success': True,
+        'format': fmt,
+        'results': [batch_entry(out, inline) for out in outputs]
+    })
 
 @bp.route('/api/image-to-jpg-zip', methods=['POST'])
 def api_jpg_zip():
-    urls = (request.get_json() or {}).get('files', [])
-    data = zip_data_urls(urls, 'jpg.zip')
-    return (data, 200, {
-        'Content-Type': 'application/zip',
-        'Content-Disposition': 'attachment; filename=converted_images.zip'
-    })
+    return zip_response('jpg', 'converted_images.zip')
 
 @bp.route('/api/image-to-png-zip', methods=['POST'])
 def api_png_zip():
-    urls = (request.get_json() or {}).get('files', [])
-    data = zip_data_urls(urls, 'png.zip')
-    return (data, 200, {
-        'Content-Type': 'application/zip',
-        'Content-Disposition': 'attachment; filename=converted_images.zip'
-    })
+    return zip_response('png', 'converted_images.zip')
 
 @bp.route('/api/image-to-webp-zip', methods=['POST'])
 def api_webp_zip():
-    urls = (request.get_json() or {}).get('files', [])
-    data = zip_data_urls(urls, 'webp.zip')
-    return (data, 200, {
-        'Content-Type': 'application/zip',
-        'Content-Disposition': 'attachment; filename=converted_images.zip'
-    })
+    return zip_response('webp', 'converted_images.zip')
+
+@bp.route('/api/image-to-avif-zip', methods=['POST'])
+def api_avif_zip():
+    return zip_response('avif', 'converted_images.zip')
 
 @bp.route('/api/image-to-pdf-zip', methods=['POST'])
 def api_pdf_zip():
-    urls = (request.get_json() or {}).get('files', [])
-    data = zip_data_urls(urls, 'pdf.zip')
-    return (data, 200, {
-        'Content-Type': 'application/zip',
-        'Content-Disposition': 'attachment; filename=converted_pdfs.zip'
-    })
\ No newline at end of file
+    return zip_response('pdf', 'converted_pdfs.zip')
\ No newline at end of file
@@ -0,0 +1,170 @@
+"""
+Jobs API - submit long-running image work and follow its progress
+
+POST   /api/jobs                 -> 202 {job_id, status_url, events_url}
+GET    /api/jobs/<id>            -> status, progress and results
+GET    /api/jobs/<id>/events     -> Server-Sent Events (progress, then done/failed);
+                                    503 + Retry-After when too many are open
+DELETE /api/jobs/<id>            -> cancel
+"""
+
+import json
+import os
+import threading
+import time
+
+from flask import Blueprint, request, jsonify, Response, url_for, stream_with_context
+
+from services.jobs import job_queue, FINISHED
+from services.image_pipeline import reduce_options, target_dimensions
+from services.convert_engine import normalize_format
+from services.api_keys import require_api_key
+from services.admission import admit, rejection_headers, AdmissionRejected
+import services.job_handlers  # noqa: F401  (registers the job kinds)
+from blueprints.image_convert_api import convert_options, admit_upload
+
+bp = Blueprint('jobs_api', __name__)
+
+# How often the SSE stream re-reads the job row, and for how long at most
+EVENTS_POLL_SECONDS = 0.5
+EVENTS_KEEPALIVE_SECONDS = 15
+EVENTS_MAX_SECONDS = 60
+# Each open stream holds a request thread; past this many per worker,
+# clients get a 503 and should poll the status URL instead
+EVENTS_MAX_STREAMS = int(os.getenv('EVENTS_MAX_STREAMS', '2'))
+EVENTS_RETRY_AFTER = 5
+
+_streams = threading.BoundedSemaphore(EVENTS_MAX_STREAMS)
+
+
+def job_payload(job):
+    """Job status with download URLs filled in for finished results"""
+    for result in job['results'] or []:
+        if 'id' in result:
+            result['download_url'] = url_for('download_result', result_id=result['id'],
+                                             filename=result['filename'])
+    return job
+
+
+def _options_for(kind, uploads):
+    """Validate the kind's form options and admit each upload (413 early)"""
+    if kind == 'reduce-images':
+        options = reduce_options(request.form)
+        for data in uploads:
+            admit(data, plan=lambda img: target_dimensions(img, options))
+        return options
+    if kind == 'convert':
+        fmt = normalize_format(request.form.get('format'))
+        options = convert_options()
+        return {
+            'format': fmt,
+            'options': options,
+            # Per file, with max_width/max_height tightened for oversized
+            # uploads when ADMISSION_DOWNSCALE is on (as /api/convert does)
+            'file_options': [admit_upload(data, options)[1] for data in uploads],
+            'merge': request.form.get('merge', '').lower() in ('1', 'true', 'yes'),
+        }
+    if kind == 'background-remove':
+        for data in uploads:
+            admit(data)
+        return {}
+    raise ValueError(f'Unknown job type: {kind}')
+
+
+@bp.route('/api/jobs', methods=['POST'])
+@require_api_key(optional=True)
+def submit_job():
+    """
+    Form: kind (reduce-images / convert / background-remove), files[] and
+    the same options as the matching synchronous endpoint.
+    """
+    kind = request.form.get('kind', '')
+    files = [f for f in request.files.getlist('files[]') if f and f.filename]
+    if not files:
+        return jsonify({'success': False, 'error': 'No files uploaded'}), 400
+
+    uploads = [f.stream.read() for f in files]
+    try:
+        options = _options_for(kind, uploads)
+        job_id = job_queue.submit(kind, [(f.filename, data) for f, data in zip(files, uploads)], options)
+    except AdmissionRejected as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status, rejection_headers(e)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status_url': url_for('jobs_api.job_status', job_id=job_id),
+        'events_url': url_for('jobs_api.job_events', job_id=job_id),
+    }), 202
+
+
+@bp.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found or expired'}), 404
+    return jsonify({'success': True, 'job': job_payload(job)})
+
+
+@bp.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    if job_queue.get(job_id) is None:
+        return jsonify({'success': False, 'error': 'Job not found or expired'}), 404
+    if not job_queue.cancel(job_id):
+        return jsonify({'success': False, 'error': 'Job already finished'}), 409
+    return jsonify({'success': True})
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@bp.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Progress events until the job finishes; clients can fall back to polling"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found or expired'}), 404
+    if not _streams.acquire(blocking=False):
+        return jsonify({
+            'success': False,
+            'error': 'Too many progress streams, poll status_url instead',
+            'status_url': url_for('jobs_api.job_status', job_id=job_id),
+        }), 503, {'Retry-After': str(EVENTS_RETRY_AFTER)}
+
+    @stream_with_context
+    def stream(job):
+        deadline = time.monotonic() + EVENTS_MAX_SECONDS
+        last = None
+        last_sent = time.monotonic()
+        while True:
+            state = (job['status'], job['done'], job['message'])
+            if job['status'] in FINISHED:
+                yield _sse(job['status'], job_payload(job))
+                return
+            now = time.monotonic()
+            if state != last:
+                yield _sse('progress', job_payload(job))
+                last, last_sent = state, now
+            elif now > deadline:
+                # Let the client reconnect rather than pin a thread forever
+                yield _sse('timeout', {'id': job_id})
+                return
+            elif now - last_sent > EVENTS_KEEPALIVE_SECONDS:
+                yield ': keep-alive\n\n'
+                last_sent = now
+            time.sleep(EVENTS_POLL_SECONDS)
+            job = job_queue.get(job_id)
+            if job is None:
+                yield _sse('expired', {'id': job_id})
+                return
+
+    response = Response(stream(job), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    # Runs when the server closes the response, even if it never streamed
+    response.call_on_close(_streams.release)
+    return response
@@ -0,0 +1,54 @@
+# Gunicorn hooks - picked up automatically from the working directory
+# (or explicitly with `-c gunicorn.conf.py`). Worker counts/timeouts stay on
+# the command line in the Dockerfile / systemd unit.
+
+
+def when_ready(server):
+    """Master start-up: fetch the rembg model file once, before any fork,
+    set up the databases and sweep the result store's disk copies.
+    No ONNX session is created here, so this is safe with --preload."""
+    from services.bg_removal import bg_remover
+    try:
+        bg_remover.prefetch()
+    except Exception as e:
+        server.log.warning("rembg model prefetch failed: %s", e)
+
+    # Tables and schema migrations, once, before any worker serves
+    from application import init_databases
+    init_databases()
+
+    # Expired or over-budget result copies left by the previous run
+    from services.result_store import results
+    results.sweep()
+
+
+def post_fork(server, worker):
+    """Per-worker start-up: pre-fork the image process pool, start the job
+    threads and warm rembg"""
+    from services import process_pool
+    process_pool.warm_up()
+    server.log.info("Worker %s: image pool ready (%s processes)", worker.pid, process_pool.POOL_WORKERS)
+
+    from services.jobs import job_queue
+    job_queue.start()
+
+    from services.bg_removal import bg_remover, REMBG_WARMUP
+    if REMBG_WARMUP:
+        try:
+            bg_remover.warm_up()
+            server.log.info("Worker %s: rembg '%s' warm in %.0f ms", worker.pid,
+                            bg_remover.model_name, bg_remover.warm_up_time * 1000)
+        except Exception as e:
+            server.log.warning("Worker %s: rembg warm-up failed: %s", worker.pid, e)
+
+
+def worker_exit(server, worker):
+    from services import process_pool
+    process_pool.shutdown()
+
+    # Write out buffered api_usage rows before the worker goes away
+    from services.usage_log import usage_writer
+    usage_writer.close()
+
+    from services.tool_usage import tool_usage
+    tool_usage.close()
@@ -63,13 +63,13 @@ class APIKey(db.Model):
     __tablename__ = 'api_keys'
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=True)  # User সাথে সম্পর্ক (use String to match users.id)
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=True, index=True)  # User সাথে সম্পর্ক (use String to match users.id)
     key_hash = db.Column(db.String(255), unique=True, nullable=False)  # হ্যাশড কী
     key_prefix = db.Column(db.String(10), nullable=False)  # প্রথম ১০ চর (দেখানোর জন্য)
     
     # প্রজেক্ট তথ্য
     project_name = db.Column(db.String(255), nullable=False)
-    email = db.Column(db.String(255), nullable=False)
+    email = db.Column(db.String(255), nullable=False, index=True)
     plan = db.Column(db.String(50), default='free')  # free/premium/enterprise
     
     # Status
@@ -105,20 +105,9 @@ class APIKey(db.Model):
         return True
     
     def get_usage_stats(self, hours=24):
-        """গত ২৪ ঘন্টার usage stats"""
-        from datetime import timedelta
-        cutoff = datetime.utcnow() - timedelta(hours=hours)
-        recent_logs = APIUsage.query.filter(
-            APIUsage.api_key_id == self.id,
-            APIUsage.created_at >= cutoff
-        ).all()
-        
-        return {
-            'total_requests': len(recent_logs),
-            'successful': len([l for l in recent_logs if l.status == 'success']),
-            'failed': len([l for l in recent_logs if l.status == 'error']),
-            'avg_processing_time': sum([l.processing_time or 0 for l in recent_logs]) / len(recent_logs) if recent_logs else 0
-        }
+        """গত ২৪ ঘন্টার usage stats (COUNT/SUM in SQL)"""
+        from services.usage_stats import usage_stats
+        return usage_stats(self.id, hours=hours)
     
     def to_dict(self):
         """API response এর জন্য dict format"""
@@ -138,6 +127,11 @@ class APIKey(db.Model):
 class APIUsage(db.Model):
     """API Usage Logging এবং Analytics"""
     __tablename__ = 'api_usage'
+    __table_args__ = (
+        # Per-key time-range scans (stats pages, usage history); status and
+        # processing_time ride along so stats never touch the table rows
+        db.Index('ix_api_usage_key_created_cover', 'api_key_id', 'created_at', 'status', 'processing_time'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     api_key_id = db.Column(db.String(36), db.ForeignKey('api_keys.id'), nullable=False)
@@ -178,6 +172,37 @@ class APIUsage(db.Model):
         }
 
 
+class UsageBucketMixin:
+    """Pre-aggregated api_usage counters for one time bucket.
+    The primary key is the bucket's dimensions, so rollups are upserts."""
+    api_key_id = db.Column(db.String(36), primary_key=True)
+    bucket_start = db.Column(db.DateTime, primary_key=True)  # UTC, truncated
+    endpoint = db.Column(db.String(255), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    model_used = db.Column(db.String(50), primary_key=True, default='')  # '' = none
+    
+    requests = db.Column(db.Integer, nullable=False, default=0)
+    time_sum = db.Column(db.Float, nullable=False, default=0.0)  # processing_time এর যোগফল
+
+
+class APIUsageHourly(UsageBucketMixin, db.Model):
+    """Hourly usage buckets (last few days only)"""
+    __tablename__ = 'api_usage_hourly'
+
+
+class APIUsageDaily(UsageBucketMixin, db.Model):
+    """Daily usage buckets (kept indefinitely)"""
+    __tablename__ = 'api_usage_daily'
+
+
+class UsageRollupState(db.Model):
+    """Rollup bookkeeping: `live_since` and `backfilled_until` timestamps"""
+    __tablename__ = 'usage_rollup_state'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.DateTime, nullable=False)
+
+
 class APIKeyRequest(db.Model):
     """API Key Request/Approval (Optional - for premium features)"""
     __tablename__ = 'api_key_requests'
@@ -0,0 +1,106 @@
+"""
+Query plans and timings for the hot api_keys/api_usage lookups, before and
+after the schema migrations.
+
+Builds a throwaway SQLite database with the pre-migration schema (no
+indexes beyond primary keys and api_usage.created_at), fills it with
+synthetic keys and usage rows, prints EXPLAIN QUERY PLAN plus the median
+time of each query, runs migrate(), and prints both again.
+
+    python scripts/explain_indexes.py [--keys 2000] [--rows 300000]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import text
+
+from models_api import db, APIKey, APIUsage
+from services import database
+from services.migrations import migrate
+
+QUERIES = {
+    'keys by email': ('SELECT * FROM api_keys WHERE email = :email', {}),
+    'keys by user_id': ('SELECT * FROM api_keys WHERE user_id = :user_id', {}),
+    'key by id+email': ('SELECT * FROM api_keys WHERE id = :key_id AND email = :email', {}),
+    'usage history': ('SELECT * FROM api_usage WHERE api_key_id = :key_id '
+                      'ORDER BY created_at DESC LIMIT 100', {}),
+    'usage 24h stats': ('SELECT status, count(*), sum(coalesce(processing_time, 0)) FROM api_usage '
+                        'WHERE api_key_id = :key_id AND created_at >= :cutoff GROUP BY status', {}),
+}
+
+
+def build(engine, keys, rows):
+    with engine.begin() as conn:
+        # The schema as deployed before the migrations
+        for name in ('ix_api_keys_email', 'ix_api_keys_user_id', 'ix_api_usage_key_created_cover'):
+            conn.execute(text(f'DROP INDEX IF EXISTS {name}'))
+        key_rows = [{
+            'id': str(uuid.uuid4()), 'user_id': str(uuid.uuid4()), 'key_hash': uuid.uuid4().hex,
+            'key_prefix': 'ck_', 'project_name': f'project {i}', 'email': f'user{i}@example.com',
+            'plan': 'free', 'is_active': True, 'requests_per_minute': 10, 'created_at': datetime.utcnow(),
+        } for i in range(keys)]
+        conn.execute(APIKey.__table__.insert(), key_rows)
+        now = datetime.utcnow()
+        for start in range(0, rows, 50_000):
+            conn.execute(APIUsage.__table__.insert(), [{
+                'id': str(uuid.uuid4()), 'api_key_id': random.choice(key_rows)['id'],
+                'endpoint': '/api/convert', 'method': 'POST',
+                'status': random.choice(('success', 'success', 'success', 'error')),
+                'processing_time': random.uniform(0.05, 2.0),
+                'created_at': now - timedelta(minutes=random.uniform(0, 60 * 24 * 30)),
+            } for _ in range(min(50_000, rows - start))])
+        conn.execute(text('ANALYZE'))
+    return key_rows[len(key_rows) // 2]
+
+
+def report(engine, sample, label, repeat=50):
+    params = {'email': sample['email'], 'user_id': sample['user_id'], 'key_id': sample['id'],
+              'cutoff': datetime.utcnow() - timedelta(hours=24)}
+    print(f'\n=== {label} ===')
+    with engine.connect() as conn:
+        for name, (sql, _) in QUERIES.items():
+            plan = conn.execute(text('EXPLAIN QUERY PLAN ' + sql), params).fetchall()
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                conn.execute(text(sql), params).fetchall()
+                timings.append(time.perf_counter() - started)
+            print(f'{name:18s} {statistics.median(timings) * 1000:8.3f} ms   '
+                  + ' | '.join(row[-1] for row in plan))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--keys', type=int, default=2000)
+    parser.add_argument('--rows', type=int, default=300_000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'explain.db')
+    app = Flask(__name__)
+    database.init_app(app, f'sqlite:///{path}')
+    # Always the throwaway file, whatever DATABASE_URL says
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        sample = build(db.engine, args.keys, args.rows)
+        report(db.engine, sample, 'before migrations')
+        migrate(db.engine)
+        with db.engine.begin() as conn:
+            conn.execute(text('ANALYZE'))
+        report(db.engine, sample, 'after migrations')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+Admission control for image endpoints
+
+Uploads are sized from their headers alone (no pixel decode) and each
+request reserves its estimated decode memory from a per-worker budget
+before any work starts. Requests that can never fit are rejected with 413;
+requests that merely don't fit *right now* wait for memory to free up and
+get a 503 if it doesn't within ADMISSION_WAIT seconds.
+"""
+
+import io
+import os
+import threading
+import time
+from contextlib import contextmanager
+from PIL import Image
+
+from services.decode_planner import REDUCING_GAP
+from services.tiled import uses_strips
+
+MB = 1024 * 1024
+
+# Decoded-memory budget shared by all concurrent requests of one worker
+IMAGE_MEMORY_BUDGET = int(os.getenv('IMAGE_MEMORY_BUDGET_MB', '768')) * MB
+# Largest single image we're willing to decode at all
+MAX_DECODE_PIXELS = int(os.getenv('MAX_DECODE_PIXELS', str(80_000_000)))
+# Seconds a request may queue for budget before giving up
+ADMISSION_WAIT = float(os.getenv('ADMISSION_WAIT', '30'))
+# Shrink oversized images on decode (conversion APIs) instead of a 413
+ADMISSION_DOWNSCALE = os.getenv('ADMISSION_DOWNSCALE', '0').lower() in ('1', 'true', 'yes')
+
+# Decoded frame + converted copy + resize/encode scratch
+WORKING_COPIES = 3
+# Banded resizes: decoded frame + (smaller) output; only the resampler
+# scratch is per band, the frames still scale with image area
+TILED_WORKING_COPIES = 2
+
+# Bytes per pixel once decoded; palette/bilevel images usually end up RGB(A)
+BYTES_PER_PIXEL = {
+    '1': 4, 'P': 4, 'PA': 4, 'L': 1, 'LA': 2, 'I;16': 2, 'I;16B': 2,
+    'RGB': 3, 'YCbCr': 3, 'LAB': 3, 'HSV': 3, 'RGBA': 4, 'CMYK': 4, 'I': 4, 'F': 4,
+}
+
+# Pillow's own bomb check stays as a backstop above our limit
+Image.MAX_IMAGE_PIXELS = max(Image.MAX_IMAGE_PIXELS or 0, MAX_DECODE_PIXELS)
+
+
+class AdmissionRejected(Exception):
+    """Upload refused before decoding; `status` is the HTTP code to return"""
+
+    def __init__(self, message, status=413, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def _draft_scale(size, target):
+    """Size a JPEG draft decode will produce for `target` (1/1 .. 1/8)"""
+    width, height = size
+    for scale in (8, 4, 2):
+        if (width / scale >= target[0] * REDUCING_GAP
+                and height / scale >= target[1] * REDUCING_GAP):
+            return -(-width // scale), -(-height // scale)
+    return size
+
+
+def estimate(data, plan=None):
+    """
+    Header-only estimate of the memory needed to process `data`.
+
+    `plan(img)` may return the output size when it's known up front, which
+    lets JPEGs be costed at their reduced draft-decode size. Returns a dict
+    with the source `width`/`height`, `format`, decoded `pixels` and `cost`
+    in bytes.
+    """
+    try:
+        img = Image.open(io.BytesIO(data))
+    except Image.DecompressionBombError:
+        raise AdmissionRejected('Image dimensions are too large')
+    except Exception:
+        raise AdmissionRejected('Unsupported or corrupt image', status=400)
+
+    size = img.size
+    decoded = size
+    target = plan(img) if plan else None
+    if target and img.format == 'JPEG':
+        decoded = _draft_scale(size, target)
+    pixels = decoded[0] * decoded[1]
+    frames = getattr(img, 'n_frames', 1) if img.format in ('TIFF', 'GIF') else 1
+    # Only a strip resize avoids the full-size scratch copy
+    copies = TILED_WORKING_COPIES if uses_strips(decoded, img.mode, target) else WORKING_COPIES
+    cost = pixels * BYTES_PER_PIXEL.get(img.mode, 4) * copies * max(1, frames)
+    return {
+        'width': size[0],
+        'height': size[1],
+        'format': img.format,
+        'pixels': pixels,
+        'cost': cost,
+    }
+
+
+def downscale_limit(info):
+    """Output size that brings an oversized image back under the limits"""
+    max_pixels = min(MAX_DECODE_PIXELS, IMAGE_MEMORY_BUDGET // (4 * WORKING_COPIES))
+    # A draft decode lands between 2x and 4x the output size per side
+    max_pixels /= (REDUCING_GAP * 2) ** 2
+    scale = (max_pixels / (info['width'] * info['height'])) ** 0.5
+    return max(1, int(info['width'] * scale)), max(1, int(info['height'] * scale))
+
+
+def check(info, downscale=False):
+    """
+    Reject images that can never be processed. With `downscale`, returns a
+    (max_width, max_height) the caller must shrink to instead of rejecting.
+    """
+    too_big = info['pixels'] > MAX_DECODE_PIXELS or info['cost'] > IMAGE_MEMORY_BUDGET
+    if not too_big:
+        return None
+    if downscale and info['format'] == 'JPEG':
+        # Only JPEGs can actually be decoded smaller than their full size
+        return downscale_limit(info)
+    raise AdmissionRejected(
+        f"Image is too large to process ({info['width']}x{info['height']}, "
+        f"limit {MAX_DECODE_PIXELS // 1_000_000} MP)"
+    )
+
+
+def admit(data, plan=None, downscale=False):
+    """estimate() + check(); a forced downscale is re-costed at its new size
+    and returned as `limit`"""
+    info = estimate(data, plan)
+    limit = check(info, downscale)
+    if limit:
+        info = estimate(data, lambda img: limit)
+    info['limit'] = limit
+    return info
+
+
+def batch_cost(infos, concurrency=None):
+    """Memory a batch needs when at most `concurrency` images are decoded at once"""
+    costs = sorted((info['cost'] for info in infos), reverse=True)
+    return sum(costs[:concurrency] if concurrency else costs)
+
+
+class MemoryBudget:
+    """Counting reservation of decoded-image memory for one worker"""
+
+    def __init__(self, limit=IMAGE_MEMORY_BUDGET, wait=ADMISSION_WAIT):
+        self.limit = limit
+        self.wait = wait
+        self.in_use = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def reserve(self, cost):
+        cost = max(0, int(cost))
+        if cost > self.limit:
+            with self._cond:
+                self.rejected += 1
+            raise AdmissionRejected('Upload needs more memory than this server allows')
+
+        deadline = time.monotonic() + self.wait
+        with self._cond:
+            self.waiting += 1
+            try:
+                while self.in_use + cost > self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise AdmissionRejected('Server is busy processing other images, please retry',
+                                                status=503, retry_after=max(1, int(self.wait)))
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.in_use += cost
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_use -= cost
+                self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'limit_bytes': self.limit,
+                'in_use_bytes': self.in_use,
+                'waiting': self.waiting,
+                'rejected': self.rejected,
+            }
+
+
+# Per-worker singleton
+memory_budget = MemoryBudget()
+
+
+def rejection_headers(error):
+    return {'Retry-After': str(error.retry_after)} if error.retry_after else {}
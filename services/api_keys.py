@@ -0,0 +1,181 @@
+"""
+API key resolution with an in-process cache
+
+Resolving a key means hashing it and looking the hash up in api_keys. The
+result - key id, plan, rate limit and expiry, or "no such key" - is cached
+per worker (LRU, API_KEY_CACHE_TTL seconds; unknown keys for
+API_KEY_NEGATIVE_TTL), so a repeat request costs a hash and a dict lookup.
+Deactivating or deleting a key calls invalidate(), which also bumps a
+shared epoch file that every worker checks at most once a second.
+"""
+
+import os
+import threading
+import time
+from datetime import timezone
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, jsonify, g, make_response
+
+from models_api import APIKey
+from services.rate_limit import rate_limiter, rate_limit_headers
+from services.usage_log import record_request
+
+API_KEY_CACHE_TTL = int(os.getenv('API_KEY_CACHE_TTL', '60'))  # seconds
+API_KEY_NEGATIVE_TTL = int(os.getenv('API_KEY_NEGATIVE_TTL', '10'))
+API_KEY_CACHE_SIZE = int(os.getenv('API_KEY_CACHE_SIZE', '10000'))
+API_KEY_EPOCH_FILE = os.getenv('API_KEY_EPOCH_FILE', '/tmp/uploads/api_keys.epoch')
+
+# How often the epoch file is stat()ed for other workers' invalidations
+EPOCH_CHECK_SECONDS = 1.0
+
+
+class KeyResolver:
+    """hash(raw key) -> cached key info dict, or None for unknown/inactive keys"""
+
+    def __init__(self, ttl=API_KEY_CACHE_TTL, negative_ttl=API_KEY_NEGATIVE_TTL,
+                 max_entries=API_KEY_CACHE_SIZE, epoch_file=API_KEY_EPOCH_FILE):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.epoch_file = epoch_file
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._epoch = None
+        self._epoch_checked = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _info(api_key):
+        if api_key is None or not api_key.is_active:
+            return None
+        return {
+            'id': api_key.id,
+            'key_hash': api_key.key_hash,
+            'plan': api_key.plan or 'free',
+            'requests_per_minute': api_key.requests_per_minute,
+            # Stored as naive UTC
+            'expires_at': (api_key.expires_at.replace(tzinfo=timezone.utc).timestamp()
+                           if api_key.expires_at else None),
+        }
+
+    def _check_epoch_locked(self, now):
+        if now - self._epoch_checked < EPOCH_CHECK_SECONDS:
+            return
+        self._epoch_checked = now
+        try:
+            epoch = os.stat(self.epoch_file).st_mtime_ns
+        except OSError:
+            epoch = None
+        if epoch != self._epoch:
+            # Some worker invalidated a key: drop everything, it's cheap to refill
+            self._entries.clear()
+            self._epoch = epoch
+
+    def resolve(self, raw_key):
+        """Key info for a raw API key, or None if it isn't usable"""
+        if not raw_key:
+            return None
+        key_hash = APIKey.hash_key(raw_key)
+        now = time.time()
+
+        with self._lock:
+            self._check_epoch_locked(now)
+            cached = self._entries.get(key_hash)
+            if cached is not None and cached[1] > now:
+                self._entries.move_to_end(key_hash)
+                self.hits += 1
+                info = cached[0]
+                return info if info and not _expired(info, now) else None
+            self.misses += 1
+
+        info = self._info(APIKey.query.filter_by(key_hash=key_hash).first())
+        ttl = self.ttl if info else self.negative_ttl
+        with self._lock:
+            self._entries[key_hash] = (info, now + ttl)
+            self._entries.move_to_end(key_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return info if info and not _expired(info, now) else None
+
+    def invalidate(self, key_hash):
+        """Forget `key_hash` here and tell the other workers to flush"""
+        with self._lock:
+            self._entries.pop(key_hash, None)
+        try:
+            os.makedirs(os.path.dirname(self.epoch_file) or '.', exist_ok=True)
+            with open(self.epoch_file, 'a'):
+                pass
+            os.utime(self.epoch_file)
+        except OSError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def _expired(info, now):
+    return info['expires_at'] is not None and info['expires_at'] < now
+
+
+# Per-worker singleton
+key_resolver = KeyResolver()
+
+
+def request_api_key():
+    """Raw key from X-API-Key, `Authorization: Bearer`, or an api_key field"""
+    key = request.headers.get('X-API-Key')
+    if not key:
+        auth = request.headers.get('Authorization', '')
+        if auth.lower().startswith('bearer '):
+            key = auth[7:]
+    if not key and request.is_json:
+        key = (request.get_json(silent=True) or {}).get('api_key')
+    if not key:
+        key = request.form.get('api_key')
+    return (key or '').strip() or None
+
+
+def require_api_key(optional=False):
+    """
+    Authenticate and rate-limit the request's API key.
+
+    The key info is left in `g.api_key` (None for anonymous requests when
+    `optional`). A key that is presented must be valid even when optional.
+    Keyed requests are logged to api_usage through the batched usage writer.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            raw_key = request_api_key()
+            if raw_key is None:
+                if optional:
+                    g.api_key = None
+                    return f(*args, **kwargs)
+                return jsonify({'success': False, 'error': 'API key required'}), 401
+
+            info = key_resolver.resolve(raw_key)
+            if info is None:
+                return jsonify({'success': False, 'error': 'Invalid or inactive API key'}), 401
+
+            started = time.perf_counter()
+            limit = rate_limiter.check(info['key_hash'], info['requests_per_minute'])
+            if not limit['allowed']:
+                record_request(info['id'], 429, started, status='rate_limited')
+                return jsonify({
+                    'success': False,
+                    'error': 'Rate limit exceeded',
+                    'retry_after': limit['retry_after']
+                }), 429, rate_limit_headers(limit)
+
+            g.api_key = info
+            # make_response keeps the view's own status/headers
+            response = make_response(f(*args, **kwargs))
+            response.headers.extend(rate_limit_headers(limit))
+            record_request(info['id'], response.status_code, started)
+            return response
+        return decorated_function
+    return decorator
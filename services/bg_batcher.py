@@ -0,0 +1,142 @@
+"""
+Micro-batching for background removal
+
+Concurrent requests are collected for a few milliseconds, normalised to the
+model's input size and pushed through a single onnxruntime call; the alpha
+masks are then scattered back to the waiting request threads.
+
+Only models with a known input spec and a dynamic batch dimension are
+batched; anything else goes straight through rembg.remove().
+"""
+
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+from rembg.bg import fix_image_orientation, naive_cutout
+
+BG_BATCHING = os.getenv('BG_BATCHING', 'true').lower() == 'true'
+BG_BATCH_WINDOW_MS = float(os.getenv('BG_BATCH_WINDOW_MS', '10'))
+BG_BATCH_MAX = int(os.getenv('BG_BATCH_MAX', '8'))
+
+_U2NET_SPEC = ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320))
+
+# model name -> (mean, std, input size), as used by the rembg sessions
+MODEL_SPECS = {
+    'u2net': _U2NET_SPEC,
+    'u2netp': _U2NET_SPEC,
+    'u2net_human_seg': _U2NET_SPEC,
+    'silueta': _U2NET_SPEC,
+    'isnet-general-use': ((0.5, 0.5, 0.5), (1.0, 1.0, 1.0), (1024, 1024)),
+}
+
+
+class _Request:
+    __slots__ = ('img', 'done', 'result', 'error')
+
+    def __init__(self, img):
+        self.img = img
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class InferenceBatcher:
+    """Queue + collector thread in front of one rembg session"""
+
+    def __init__(self, get_session, model_name, window_ms=BG_BATCH_WINDOW_MS,
+                 max_batch=BG_BATCH_MAX):
+        self.get_session = get_session
+        self.model_name = model_name
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+        self._supported = None
+        self.batches = 0
+        self.batched_images = 0
+
+    def supported(self):
+        """True if the model spec is known and its batch dimension is dynamic"""
+        if self._supported is None:
+            if self.model_name not in MODEL_SPECS:
+                self._supported = False
+            else:
+                batch_dim = self.get_session().inner_session.get_inputs()[0].shape[0]
+                self._supported = not isinstance(batch_dim, int)
+        return self._supported
+
+    def _ensure_thread(self):
+        # Threads don't survive fork, so (re)start per process
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid != os.getpid():
+                self._queue = queue.Queue()
+                threading.Thread(target=self._run, daemon=True,
+                                 name='bg-batcher').start()
+                self._thread_pid = os.getpid()
+
+    def submit(self, img):
+        """Cut out `img`; blocks until its batch has been processed"""
+        self._ensure_thread()
+        request = _Request(img)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                results = self.process([r.img for r in batch])
+                for request, result in zip(batch, results):
+                    request.result = result
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+            finally:
+                for request in batch:
+                    request.done.set()
+
+    def process(self, images):
+        """One onnxruntime call for all `images`; returns RGBA cutouts"""
+        session = self.get_session()
+        mean, std, size = MODEL_SPECS[self.model_name]
+
+        images = [fix_image_orientation(img) for img in images]
+        inputs = [session.normalize(img, mean, std, size) for img in images]
+        input_name = next(iter(inputs[0]))
+        stacked = np.concatenate([i[input_name] for i in inputs], axis=0)
+
+        preds = session.inner_session.run(None, {input_name: stacked})[0][:, 0, :, :]
+        self.batches += 1
+        self.batched_images += len(images)
+
+        cutouts = []
+        for img, pred in zip(images, preds):
+            ma, mi = np.max(pred), np.min(pred)
+            pred = (pred - mi) / max(ma - mi, 1e-6)
+            mask = Image.fromarray((pred.clip(0, 1) * 255).astype('uint8'))
+            mask = mask.resize(img.size, Image.Resampling.LANCZOS)
+            cutouts.append(naive_cutout(img, mask))
+        return cutouts
@@ -0,0 +1,146 @@
+"""
+Content-addressed cache for background-removal output
+
+Keyed by sha256(model name + input bytes) and storing the PNG cut-out, with
+an in-process LRU tier in front of an on-disk tier that is trimmed
+oldest-first when it grows past its size budget.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+BG_CACHE_MEMORY_BYTES = int(os.getenv('BG_CACHE_MEMORY_MB', '64')) * 1024 * 1024
+BG_CACHE_DISK_BYTES = int(os.getenv('BG_CACHE_DISK_MB', '512')) * 1024 * 1024
+BG_CACHE_DIR = os.getenv('BG_CACHE_DIR', '/tmp/uploads/bg_cache')
+
+
+class CutoutCache:
+    """Two-tier (memory LRU + disk) PNG cache"""
+
+    def __init__(self, memory_bytes=BG_CACHE_MEMORY_BYTES, disk_bytes=BG_CACHE_DISK_BYTES,
+                 root=BG_CACHE_DIR):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.root = root
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._disk_used = None
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(data, model_name):
+        digest = hashlib.sha256(model_name.encode())
+        digest.update(b'\0')
+        digest.update(data)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], f'{key}.png')
+
+    def get(self, key):
+        """Return cached PNG bytes for `key`, or None on a miss"""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return data
+
+        try:
+            with open(self._path(key), 'rb') as f:
+                data = f.read()
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.disk_hits += 1
+            self._remember_locked(key, data)
+        return data
+
+    def put(self, key, data):
+        with self._lock:
+            self._remember_locked(key, data)
+
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write-then-rename so other workers never read a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        self._account_disk(len(data))
+
+    def _remember_locked(self, key, data):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return
+        self._entries[key] = data
+        self._bytes += len(data)
+        while self._bytes > self.memory_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def _scan_disk(self):
+        files = []
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def _account_disk(self, added):
+        with self._lock:
+            if self._disk_used is None:
+                self._disk_used = sum(size for _, size, _ in self._scan_disk())
+            else:
+                self._disk_used += added
+            if self._disk_used <= self.disk_bytes:
+                return
+
+            # Other workers share the directory, so trim from a fresh scan
+            files = sorted(self._scan_disk())
+            used = sum(size for _, size, _ in files)
+            for _, size, path in files:
+                if used <= self.disk_bytes * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                    used -= size
+                except OSError:
+                    pass
+            self._disk_used = used
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'pid': os.getpid(),
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else None,
+                'memory_entries': len(self._entries),
+                'memory_bytes': self._bytes,
+                'disk_bytes': self._disk_used,
+            }
+
+
+# Shared per-worker instance
+cutout_cache = CutoutCache()
@@ -0,0 +1,124 @@
+"""
+Background removal service - one persistent rembg session per worker
+
+The ONNX session is created once per process (never in the gunicorn master,
+so it is safe with --preload) and warmed with a dummy inference at worker
+boot, so the first real request doesn't pay the model load.
+"""
+
+import io
+import os
+import threading
+import time
+from PIL import Image
+from rembg import remove, new_session
+from rembg.sessions import sessions_class
+
+from services.bg_batcher import InferenceBatcher, BG_BATCHING
+from services.bg_cache import cutout_cache
+
+REMBG_MODEL = os.getenv('REMBG_MODEL', 'u2net')
+REMBG_WARMUP = os.getenv('REMBG_WARMUP', 'true').lower() == 'true'
+
+
+class BackgroundRemover:
+    """Owns this worker's rembg session and its latency numbers"""
+
+    def __init__(self, model_name=REMBG_MODEL):
+        self.model_name = model_name
+        self._session = None
+        self._session_pid = None
+        self._lock = threading.Lock()
+        self.load_time = None
+        self.warm_up_time = None
+        self.calls = 0
+        self.total_time = 0.0
+        self.last_time = None
+        self.batcher = InferenceBatcher(self.session, model_name) if BG_BATCHING else None
+
+    def prefetch(self):
+        """Download the model file without creating a session (master-safe)"""
+        for session_class in sessions_class:
+            if session_class.name() == self.model_name:
+                session_class.download_models()
+                return
+        raise ValueError(f"Unknown rembg model '{self.model_name}'")
+
+    def session(self):
+        """Return this process's session, loading the model on first use"""
+        if self._session is not None and self._session_pid == os.getpid():
+            return self._session
+        with self._lock:
+            if self._session is None or self._session_pid != os.getpid():
+                start = time.perf_counter()
+                self._session = new_session(self.model_name)
+                self._session_pid = os.getpid()
+                self.load_time = time.perf_counter() - start
+        return self._session
+
+    def loaded(self):
+        return self._session is not None and self._session_pid == os.getpid()
+
+    def warm_up(self):
+        """Load the model and run one dummy inference"""
+        start = time.perf_counter()
+        remove(Image.new('RGB', (64, 64), (255, 255, 255)), session=self.session())
+        self.warm_up_time = time.perf_counter() - start
+
+    def remove(self, img):
+        """Cut out `img` (PIL image) with the persistent session"""
+        start = time.perf_counter()
+        if self.batcher is not None and self.batcher.supported():
+            output = self.batcher.submit(img)
+        else:
+            output = remove(img, session=self.session())
+        elapsed = time.perf_counter() - start
+        self.calls += 1
+        self.total_time += elapsed
+        self.last_time = elapsed
+        return output
+
+    def health(self, probe=False):
+        """Status for the health endpoint; `probe` times a tiny inference"""
+        info = {
+            'model': self.model_name,
+            'pid': os.getpid(),
+            'loaded': self.loaded(),
+            'load_ms': _ms(self.load_time),
+            'warm_up_ms': _ms(self.warm_up_time),
+            'calls': self.calls,
+            'last_ms': _ms(self.last_time),
+            'avg_ms': _ms(self.total_time / self.calls) if self.calls else None,
+            'batching': self.batcher is not None and self.loaded() and self.batcher.supported(),
+        }
+        if self.batcher is not None:
+            info['batches'] = self.batcher.batches
+            info['batched_images'] = self.batcher.batched_images
+        if probe:
+            start = time.perf_counter()
+            remove(Image.new('RGB', (32, 32)), session=self.session())
+            info['probe_ms'] = _ms(time.perf_counter() - start)
+            info['loaded'] = True
+        return info
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+# Shared per-worker instance
+bg_remover = BackgroundRemover()
+
+
+def cutout_png(file_bytes, img=None):
+    """PNG cut-out of the uploaded bytes; cache hits skip inference entirely"""
+    key = cutout_cache.key(file_bytes, bg_remover.model_name)
+    png = cutout_cache.get(key)
+    if png is None:
+        if img is None:
+            img = Image.open(io.BytesIO(file_bytes)).convert("RGBA")
+        buf = io.BytesIO()
+        bg_remover.remove(img).save(buf, format='PNG')
+        png = buf.getvalue()
+        cutout_cache.put(key, png)
+    return png
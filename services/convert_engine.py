@@ -0,0 +1,134 @@
+"""
+Conversion engine - one code path for every image -> format conversion
+
+Used by the single-file /api/image-to-* routes and by the batch
+/api/convert route, which fans the encodes out over the process pool and can
+also merge all inputs into one multi-page PDF.
+"""
+
+import io
+import os
+from PIL import Image, features
+
+from services.decode_planner import fit_within, open_for_target, resize_to
+
+# format -> Pillow format, MIME type, file extension and default save options
+FORMATS = {
+    'jpeg': {'pil': 'JPEG', 'mime': 'image/jpeg', 'ext': 'jpg',
+             'options': {'quality': 95, 'optimize': True}},
+    'png': {'pil': 'PNG', 'mime': 'image/png', 'ext': 'png',
+            'options': {'optimize': True}},
+    'webp': {'pil': 'WEBP', 'mime': 'image/webp', 'ext': 'webp',
+             'options': {'quality': 90, 'method': 6}},
+    'avif': {'pil': 'AVIF', 'mime': 'image/avif', 'ext': 'avif',
+             'options': {'quality': 80, 'speed': 6}},
+    'pdf': {'pil': 'PDF', 'mime': 'application/pdf', 'ext': 'pdf',
+            'options': {'resolution': 300.0}},
+}
+
+ALIASES = {'jpg': 'jpeg'}
+
+MIME_EXTENSIONS = {spec['mime']: spec['ext'] for spec in FORMATS.values()}
+
+
+def normalize_format(fmt):
+    """Validate a requested format name ('JPG', 'webp', ...)"""
+    fmt = ALIASES.get((fmt or '').lower(), (fmt or '').lower())
+    if fmt not in FORMATS:
+        raise ValueError('Unsupported format')
+    if fmt == 'avif' and not features.check('avif'):
+        raise ValueError('AVIF is not supported on this server')
+    return fmt
+
+
+def _prepare(img, fmt):
+    """Convert to a mode the target format can store"""
+    if fmt in ('jpeg', 'pdf'):
+        return img.convert('RGB') if img.mode != 'RGB' else img
+    if img.mode in ('CMYK', 'YCbCr', 'LAB', 'HSV', 'I;16'):
+        return img.convert('RGB')
+    if fmt in ('webp', 'avif') and img.mode not in ('RGB', 'RGBA'):
+        return img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+    return img
+
+
+def _save_options(fmt, options):
+    params = dict(FORMATS[fmt]['options'])
+    quality = (options or {}).get('quality')
+    if quality and 'quality' in params:
+        params['quality'] = max(1, min(100, int(quality)))
+    return params
+
+
+def _output_size(img, options):
+    """Size the output must fit in (max_width/max_height), or None"""
+    options = options or {}
+    max_width, max_height = options.get('max_width'), options.get('max_height')
+    if not max_width and not max_height:
+        return None
+    size = fit_within(img.size, max_width, max_height)
+    return size if size != img.size else None
+
+
+def convert_bytes(data, fmt, options=None):
+    """
+    Convert one encoded image to `fmt`.
+
+    Returns a dict with the encoded `data`, its `mime`, `ext`, byte `size`
+    and the output `pixels` ("WxH"). With max_width/max_height in `options`
+    the image is shrunk to fit, decoding JPEGs at reduced scale.
+    """
+    fmt = normalize_format(fmt)
+    spec = FORMATS[fmt]
+    img = Image.open(io.BytesIO(data))
+    target = _output_size(img, options)
+    if target:
+        img = resize_to(open_for_target(img, target), target)
+    size_px = (img.width, img.height)
+
+    buf = io.BytesIO()
+    _prepare(img, fmt).save(buf, format=spec['pil'], **_save_options(fmt, options))
+    out = buf.getvalue()
+    return {
+        'mime': spec['mime'],
+        'ext': spec['ext'],
+        'pixels': f'{size_px[0]}x{size_px[1]}',
+        'size': len(out),
+        'data': out,
+    }
+
+
+def convert_named(data, filename, fmt, options=None):
+    """Batch worker: like convert_bytes, but reports failures per file"""
+    try:
+        out = convert_bytes(data, fmt, options)
+    except Exception as e:
+        return {'name': filename, 'error': str(e)}
+    out['name'] = f"{os.path.splitext(filename)[0] or 'converted'}.{out['ext']}"
+    return out
+
+
+def merge_to_pdf(items, options=None, page_options=None):
+    """Combine encoded images (in order) into one multi-page PDF.
+    `page_options` optionally overrides max_width/max_height per page."""
+    pages = []
+    for i, data in enumerate(items):
+        img = Image.open(io.BytesIO(data))
+        target = _output_size(img, page_options[i] if page_options else options)
+        if target:
+            img = resize_to(open_for_target(img, target), target)
+        pages.append(_prepare(img, 'pdf'))
+    if not pages:
+        raise ValueError('No images to merge')
+    buf = io.BytesIO()
+    pages[0].save(buf, format='PDF', save_all=True, append_images=pages[1:],
+                  **_save_options('pdf', options))
+    out = buf.getvalue()
+    return {
+        'mime': 'application/pdf',
+        'ext': 'pdf',
+        'pixels': f'{pages[0].width}x{pages[0].height}',
+        'pages': len(pages),
+        'size': len(out),
+        'data': out,
+    }
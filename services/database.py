@@ -0,0 +1,120 @@
+"""
+Database connections - engine options, SQLite pragmas, DATABASE_URL
+
+Every SQLite connection, whether it comes from the Flask-SQLAlchemy engine
+(chatbot_api.db) or from the raw sqlite3 helpers below (usage.db, jobs.db),
+is switched to WAL with synchronous=NORMAL, a busy_timeout, a page cache
+and mmap'd reads. WAL lets any number of readers run alongside the one
+writer instead of failing with "database is locked"; the busy_timeout
+makes a second writer wait its turn rather than error.
+
+DATABASE_URL selects another database for the models (Postgres: the
+`postgres://` scheme some hosts hand out is rewritten to `postgresql://`),
+with a pre-pinged, recycled connection pool. Pooled connections are never
+shared across a fork: a connection checked out in a process other than
+the one that opened it is discarded and replaced.
+"""
+
+import os
+import sqlite3
+import threading
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import Pool
+
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+SQLITE_MMAP_MB = int(os.getenv('SQLITE_MMAP_MB', '256'))
+SQLITE_CACHE_MB = int(os.getenv('SQLITE_CACHE_MB', '16'))
+
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))  # seconds
+
+
+def sqlite_pragmas():
+    return (
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}',
+        f'PRAGMA cache_size=-{SQLITE_CACHE_MB * 1024}',
+        f'PRAGMA mmap_size={SQLITE_MMAP_MB * 1024 * 1024}',
+        'PRAGMA temp_store=MEMORY',
+    )
+
+
+def apply_pragmas(conn):
+    cursor = conn.cursor()
+    for pragma in sqlite_pragmas():
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def database_url(default):
+    """DATABASE_URL (normalized) or `default`"""
+    url = os.getenv('DATABASE_URL') or default
+    if url.startswith('postgres://'):
+        # SQLAlchemy only accepts the postgresql:// scheme
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def engine_options(url):
+    """SQLALCHEMY_ENGINE_OPTIONS for `url`"""
+    if url.startswith('sqlite'):
+        # File databases get SQLAlchemy's per-process QueuePool; the sqlite3
+        # timeout mirrors busy_timeout for the initial connect
+        return {'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000.0}}
+    return {
+        'pool_pre_ping': True,
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_recycle': DB_POOL_RECYCLE,
+    }
+
+
+def init_app(app, default_url):
+    """Set the database URL and engine options; call before db.init_app()"""
+    url = database_url(default_url)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(url))
+    return url
+
+
+@event.listens_for(Pool, 'connect')
+def _on_connect(dbapi_connection, connection_record):
+    connection_record.info['pid'] = os.getpid()
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        apply_pragmas(dbapi_connection)
+
+
+@event.listens_for(Pool, 'checkout')
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    if connection_record.info.get('pid', os.getpid()) != os.getpid():
+        # Opened before a fork: the pool drops it and connects afresh
+        connection_record.dbapi_connection = connection_proxy.dbapi_connection = None
+        raise exc.DisconnectionError('connection belongs to another process')
+
+
+def sqlite_connect(path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000.0):
+    """A new sqlite3 connection with the standard pragmas"""
+    conn = sqlite3.connect(path, timeout=timeout)
+    apply_pragmas(conn)
+    return conn
+
+
+_local = threading.local()
+
+
+def local_connection(path):
+    """
+    This thread's long-lived connection to `path` (don't close it). For
+    hot raw-sqlite paths such as the usage.db flusher and /admin/usage.
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None or _local.pid != os.getpid():
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+    conn = connections.get(path)
+    if conn is None:
+        conn = connections[path] = sqlite_connect(path)
+    return conn
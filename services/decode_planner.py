@@ -0,0 +1,59 @@
+"""
+Decode planner - don't decode pixels that a downscale will throw away
+
+When the output size is known before decoding, JPEGs are opened with
+Image.draft() so libjpeg's DCT scaling decodes at 1/2, 1/4 or 1/8 size.
+Other formats are decoded in full but shrunk with reduce() (box filter on
+integer factors) before the final LANCZOS pass. Very large images are
+resized band by band to bound the resampler's scratch (see services/tiled.py).
+"""
+
+from PIL import Image
+
+from services.tiled import is_large, resize_strips
+
+# Keep at least this much oversampling ahead of the final LANCZOS resize,
+# so the result is indistinguishable from a full-resolution resize
+REDUCING_GAP = 2.0
+
+
+def fit_within(size, max_width=None, max_height=None):
+    """Largest size with the same aspect ratio inside max_width x max_height"""
+    width, height = size
+    scale = 1.0
+    if max_width and width > max_width:
+        scale = min(scale, max_width / width)
+    if max_height and height > max_height:
+        scale = min(scale, max_height / height)
+    if scale >= 1.0:
+        return size
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def open_for_target(img, target_size):
+    """
+    Prepare a lazily-opened image for a downscale to `target_size`.
+
+    Must be called before the pixels are loaded; returns the same image,
+    which for JPEGs will now decode at a reduced scale.
+    """
+    if not target_size:
+        return img
+    target_width, target_height = target_size
+    if target_width >= img.width and target_height >= img.height:
+        return img
+
+    if img.format == 'JPEG':
+        requested = (int(target_width * REDUCING_GAP), int(target_height * REDUCING_GAP))
+        img.draft(img.mode, requested)
+    return img
+
+
+def resize_to(img, target_size):
+    """LANCZOS resize that reduce()s by integer factors first when it can"""
+    if img.size == tuple(target_size):
+        return img
+    if is_large(img.size):
+        return resize_strips(img, target_size, reducing_gap=REDUCING_GAP)
+    return img.resize(target_size, Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+
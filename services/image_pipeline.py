@@ -0,0 +1,150 @@
+"""
+In-memory image pipeline for /api/reduce-images
+
+Uploads are decoded straight from their bytes and every candidate encode
+goes into a buffer; callers decide whether the final artifact ever touches
+disk.
+"""
+
+import io
+import os
+from PIL import Image
+
+from services.decode_planner import open_for_target, resize_to
+from services.target_size import (
+    encode, fit_to_size, format_for_extension, prepare_for_format, search_quality,
+    QUALITY_FORMATS,
+)
+
+PRESET_DIMENSIONS = {
+    '1024x768': (1024, 768),
+    '800x800': (800, 800),
+    '800x600': (800, 600),
+    '640x480': (640, 480),
+    '350x270': (350, 270)
+}
+
+# Quality range used by the "max file size" mode
+MAX_SIZE_QUALITY_MIN = 15
+MAX_SIZE_QUALITY_MAX = 95
+
+
+def reduce_options(form):
+    """Pull the reduce-images options out of a request form"""
+    return {
+        'width': form.get('width', type=int),
+        'height': form.get('height', type=int),
+        'preset_size': form.get('preset_size'),
+        'max_file_size': form.get('max_file_size', type=int),  # in KB
+        'custom_target_size': form.get('custom_target_size', type=float),
+        'size_unit': form.get('size_unit', 'kb'),
+    }
+
+
+def target_dimensions(img, options):
+    if options.get('preset_size'):
+        return PRESET_DIMENSIONS.get(options['preset_size'], (800, 800))
+    return options.get('width') or img.width, options.get('height') or img.height
+
+
+def _pad(data, target_bytes):
+    """Append null bytes so `data` reaches `target_bytes`"""
+    if len(data) < target_bytes:
+        data += b'\x00' * (target_bytes - len(data))
+    return data
+
+
+def _encode_plain(img, fmt, **params):
+    buf = io.BytesIO()
+    img.save(buf, format=fmt, **params)
+    return buf.getvalue()
+
+
+def _increase_to(img, fmt, target_bytes):
+    """Grow the output to exactly `target_bytes` (least compression + padding)"""
+    img = prepare_for_format(img, fmt)
+    if fmt == 'PNG':
+        best = None
+        # 9=most, 0=least compression: keep the largest encode that still fits
+        for compress_level in range(9, -1, -1):
+            data = _encode_plain(img, 'PNG', optimize=False, compress_level=compress_level)
+            if len(data) <= target_bytes and (best is None or len(data) > len(best)):
+                best = data
+        data = best if best is not None else _encode_plain(img, 'PNG', optimize=False, compress_level=0)
+    elif fmt == 'JPEG':
+        data = _encode_plain(img, 'JPEG', quality=100, optimize=False)
+    else:
+        data = _encode_plain(img, fmt, optimize=False)
+    return _pad(data, target_bytes), img.size
+
+
+def _fit_max_size(img, fmt, target_bytes):
+    """Best quality under `target_bytes`, without resizing"""
+    img = prepare_for_format(img, fmt)
+    if fmt in QUALITY_FORMATS:
+        _, data = search_quality(img, fmt, target_bytes,
+                                 lo=MAX_SIZE_QUALITY_MIN, hi=MAX_SIZE_QUALITY_MAX)
+    else:
+        data = encode(img, fmt)
+    return data, img.size
+
+
+def _best_quality(img, fmt):
+    img = prepare_for_format(img, fmt)
+    try:
+        if fmt == 'JPEG':
+            return _encode_plain(img, 'JPEG', quality=95, optimize=True), img.size
+        return _encode_plain(img, fmt, optimize=True), img.size
+    except Exception:
+        return _encode_plain(img, fmt), img.size
+
+
+def reduce_image(data, filename, options):
+    """
+    Resize/re-encode one uploaded image according to the reduce-images options.
+
+    Returns a dict with the encoded output `data` plus the metadata the
+    endpoint reports back to the client.
+    """
+    img = Image.open(io.BytesIO(data))
+    original_dimensions = f"{img.width}x{img.height}"
+
+    # Target is known from the header alone, so JPEG downscales decode at
+    # reduced (DCT-scaled) resolution instead of full size
+    target = target_dimensions(img, options)
+    img = resize_to(open_for_target(img, target), target)
+
+    name, ext = os.path.splitext(filename)
+    fmt = format_for_extension(ext, img)
+
+    custom_target_size = options.get('custom_target_size')
+    max_file_size = options.get('max_file_size')
+
+    if custom_target_size:
+        # Force to a specific size
+        if options.get('size_unit') == 'mb':
+            target_size_bytes = int(custom_target_size * 1024 * 1024)
+        else:  # kb
+            target_size_bytes = int(custom_target_size * 1024)
+
+        if target_size_bytes > len(data):
+            output, size = _increase_to(img, fmt, target_size_bytes)
+        else:
+            fitted = fit_to_size(img, fmt, target_size_bytes)
+            output, size = fitted['data'], (fitted['width'], fitted['height'])
+    elif max_file_size:
+        output, size = _fit_max_size(img, fmt, max_file_size * 1024)
+    else:
+        # No size constraints - save with best quality
+        output, size = _best_quality(img, fmt)
+
+    return {
+        'original_filename': filename,
+        'output_filename': f"converted_{name}{ext}",
+        'data': output,
+        'mime': Image.MIME.get(fmt, 'application/octet-stream'),
+        'original_size': len(data),
+        'final_size': len(output),
+        'original_dimensions': original_dimensions,
+        'final_dimensions': f"{size[0]}x{size[1]}",
+    }
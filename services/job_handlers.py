@@ -0,0 +1,102 @@
+"""
+Handlers for the job queue
+
+Each handler takes a services.jobs.Job, reports per-file progress and
+returns a JSON-able list of result entries. Output bytes go to the result
+store (persisted, so any worker can serve the download); entries carry the
+result `id` and `filename` for the download URL.
+"""
+
+import os
+
+from services.jobs import handler
+from services.result_store import results as results_store
+from services.process_pool import map_ordered, MAX_IN_FLIGHT
+from services.image_pipeline import reduce_image, target_dimensions
+from services.convert_engine import convert_named, merge_to_pdf
+from services.bg_removal import cutout_png
+from services.decode_planner import fit_within
+from services.admission import admit, batch_cost, memory_budget
+
+# Jobs aren't bound by the gunicorn request timeout
+JOB_TIMEOUT = int(os.getenv('JOB_TIMEOUT', '1800'))
+
+
+def _store(data, filename, mime, **meta):
+    entry = dict(meta, filename=filename, mime=mime, size=len(data))
+    entry['id'] = results_store.put(data, filename, mime=mime, persist=True)
+    return entry
+
+
+def _fit_plan(options):
+    """Admission plan for a conversion with optional max_width/max_height"""
+    return lambda img: fit_within(img.size, options.get('max_width'), options.get('max_height'))
+
+
+def _run_batch(job, fn, args):
+    """Fan `args` out over the process pool, reporting progress per file"""
+    completed = []
+
+    def on_result(index, result):
+        completed.append(index)
+        job.progress(len(completed), message=f'Processed {job.input_names[index]}')
+
+    return map_ordered(fn, args, max_in_flight=MAX_IN_FLIGHT, timeout=JOB_TIMEOUT,
+                       on_result=on_result)
+
+
+@handler('reduce-images')
+def reduce_images_job(job):
+    jobs = [(data, name, job.options) for name, data in job.inputs()]
+    job.progress(0, message='Starting')
+    infos = [admit(data, plan=lambda img: target_dimensions(img, job.options)) for data, _, _ in jobs]
+    with memory_budget.reserve(batch_cost(infos, MAX_IN_FLIGHT)):
+        reduced = _run_batch(job, reduce_image, jobs)
+
+    results = []
+    for result in reduced:
+        data = result.pop('data')
+        mime = result.pop('mime')
+        results.append(_store(data, result['output_filename'], mime, **result))
+    return results
+
+
+@handler('convert')
+def convert_job(job):
+    fmt = job.options['format']
+    options = job.options.get('options', {})
+    files = list(job.inputs())
+    file_options = job.options.get('file_options') or [options] * len(files)
+    job.progress(0, message='Starting')
+    infos = [admit(data, plan=_fit_plan(opts)) for (_, data), opts in zip(files, file_options)]
+
+    if fmt == 'pdf' and job.options.get('merge'):
+        with memory_budget.reserve(batch_cost(infos)):
+            out = merge_to_pdf([data for _, data in files], options, file_options)
+        job.progress(len(files), message='Merged')
+        return [_store(out['data'], 'merged.pdf', out['mime'],
+                       pixels=out['pixels'], pages=out['pages'])]
+
+    with memory_budget.reserve(batch_cost(infos, MAX_IN_FLIGHT)):
+        outputs = _run_batch(job, convert_named, [(data, name, fmt, opts)
+                                                  for (name, data), opts in zip(files, file_options)])
+    results = []
+    for out in outputs:
+        if 'error' in out:
+            results.append({'filename': out['name'], 'error': out['error']})
+        else:
+            results.append(_store(out['data'], out['name'], out['mime'], pixels=out['pixels']))
+    return results
+
+
+@handler('background-remove')
+def background_remove_job(job):
+    results = []
+    job.progress(0, message='Starting')
+    for done, (name, data) in enumerate(job.inputs(), start=1):
+        with memory_budget.reserve(admit(data)['cost']):
+            png = cutout_png(data)
+        filename = f"{os.path.splitext(name)[0] or 'image'}_no_bg.png"
+        results.append(_store(png, filename, 'image/png'))
+        job.progress(done, message=f'Processed {name}')
+    return results
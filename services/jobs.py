@@ -0,0 +1,357 @@
+"""
+Job queue - long-running image work outside the request thread
+
+Jobs live in a small SQLite database (no external broker) that every
+gunicorn worker shares: a request stores the uploads under JOBS_DIR,
+inserts a queued row and returns a job id straight away. Each worker runs a
+few job threads that claim queued rows atomically, run the registered
+handler and write progress back to the row, which is what the status and
+Server-Sent Events endpoints read. Outputs go to the result store; job rows
+and their inputs expire after JOB_TTL seconds.
+"""
+
+import json
+import os
+import secrets
+import shutil
+import sqlite3
+import threading
+import time
+
+from services.database import sqlite_connect
+
+JOBS_DB = os.getenv('JOBS_DB', '/tmp/uploads/jobs.db')
+JOBS_DIR = os.getenv('JOBS_DIR', '/tmp/uploads/jobs')
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))  # threads per gunicorn worker
+JOB_TTL = int(os.getenv('JOB_TTL', '3600'))  # seconds, after finishing
+JOB_STALE = int(os.getenv('JOB_STALE', '300'))  # running without a heartbeat (sent every JOB_STALE/3)
+JOB_MAX_ATTEMPTS = 2
+# Tries at recording a finished job before leaving it to the stale sweep
+JOB_FINISH_ATTEMPTS = 3
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+FINISHED = (DONE, FAILED, CANCELLED)
+
+_SCHEMA = '''CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    options TEXT,
+    inputs TEXT,
+    done INTEGER DEFAULT 0,
+    total INTEGER DEFAULT 0,
+    message TEXT,
+    results TEXT,
+    error TEXT,
+    attempts INTEGER DEFAULT 0,
+    created_at REAL,
+    updated_at REAL,
+    finished_at REAL
+)'''
+
+# kind -> handler(job) returning the list of result dicts
+_handlers = {}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def handler(kind):
+    """Register the function that runs jobs of `kind`"""
+    def register(fn):
+        _handlers[kind] = fn
+        return fn
+    return register
+
+
+class Job:
+    """What a handler sees: its inputs, options and a progress callback"""
+
+    def __init__(self, queue, row):
+        self.queue = queue
+        self.id = row['id']
+        self.kind = row['kind']
+        self.options = json.loads(row['options'] or '{}')
+        self.input_names = json.loads(row['inputs'] or '[]')
+
+    def inputs(self):
+        """Yield (filename, bytes) for each uploaded input, in order"""
+        for i, name in enumerate(self.input_names):
+            with open(os.path.join(self.queue.job_dir(self.id), str(i)), 'rb') as f:
+                yield name, f.read()
+
+    def progress(self, done, total=None, message=None):
+        """Record progress; raises JobCancelled if the job was cancelled"""
+        if self.queue.update_progress(self.id, done, total, message) == CANCELLED:
+            raise JobCancelled()
+
+    def cancelled(self):
+        return self.queue.status(self.id) == CANCELLED
+
+
+class JobQueue:
+    """SQLite-backed queue plus this worker's job threads"""
+
+    def __init__(self, db_path=JOBS_DB, root=JOBS_DIR, workers=JOB_WORKERS, ttl=JOB_TTL):
+        self.db_path = db_path
+        self.root = root
+        self.workers = workers
+        self.ttl = ttl
+        self._wake = threading.Event()
+        self._threads_pid = None
+        self._lock = threading.Lock()
+        self._initialized = False
+        self._last_sweep = 0.0
+
+    # --- storage ---
+
+    def _connect(self):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        conn = sqlite_connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            conn.execute(_SCHEMA)
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)')
+            conn.commit()
+            self._initialized = True
+        return conn
+
+    def job_dir(self, job_id):
+        return os.path.join(self.root, job_id)
+
+    def submit(self, kind, files, options=None):
+        """
+        Queue a job. `files` is a list of (filename, bytes); returns the job id.
+        """
+        if kind not in _handlers:
+            raise ValueError(f'Unknown job type: {kind}')
+        job_id = secrets.token_urlsafe(16)
+        directory = self.job_dir(job_id)
+        os.makedirs(directory, exist_ok=True)
+        for i, (_, data) in enumerate(files):
+            with open(os.path.join(directory, str(i)), 'wb') as f:
+                f.write(data)
+
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                'INSERT INTO jobs (id, kind, status, options, inputs, total, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, kind, QUEUED, json.dumps(options or {}),
+                 json.dumps([name for name, _ in files]), len(files), now, now)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        self.start()
+        self._wake.set()
+        return job_id
+
+    def get(self, job_id):
+        """Job status as a dict, or None if unknown/expired"""
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return {
+            'id': row['id'],
+            'kind': row['kind'],
+            'status': row['status'],
+            'done': row['done'],
+            'total': row['total'],
+            'progress': round(row['done'] / row['total'], 3) if row['total'] else 0.0,
+            'message': row['message'],
+            'results': json.loads(row['results']) if row['results'] else None,
+            'error': row['error'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+            'expires_at': row['finished_at'] + self.ttl if row['finished_at'] else None,
+        }
+
+    def status(self, job_id):
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return row['status'] if row else None
+
+    def cancel(self, job_id):
+        """Cancel a queued/running job; running handlers stop at their next progress()"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            cur = conn.execute(
+                'UPDATE jobs SET status = ?, updated_at = ?, finished_at = ? '
+                'WHERE id = ? AND status IN (?, ?)',
+                (CANCELLED, now, now, job_id, QUEUED, RUNNING)
+            )
+            conn.commit()
+            return cur.rowcount > 0
+        finally:
+            conn.close()
+
+    def update_progress(self, job_id, done, total=None, message=None):
+        conn = self._connect()
+        try:
+            conn.execute(
+                'UPDATE jobs SET done = ?, total = COALESCE(?, total), message = COALESCE(?, message), '
+                'updated_at = ? WHERE id = ? AND status = ?',
+                (done, total, message, time.time(), job_id, RUNNING)
+            )
+            conn.commit()
+            row = conn.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            return row['status'] if row else None
+        finally:
+            conn.close()
+
+    def _finish(self, job_id, status, results=None, error=None):
+        try:
+            encoded = json.dumps(results) if results is not None else None
+        except (TypeError, ValueError) as e:
+            status, encoded, error = FAILED, None, f'Could not record results: {e}'
+        for attempt in range(JOB_FINISH_ATTEMPTS):
+            now = time.time()
+            try:
+                conn = self._connect()
+                try:
+                    conn.execute(
+                        'UPDATE jobs SET status = ?, results = ?, error = ?, '
+                        'done = CASE WHEN ? = ? THEN total ELSE done END, '
+                        'updated_at = ?, finished_at = ? WHERE id = ? AND status = ?',
+                        (status, encoded, error, status, DONE, now, now, job_id, RUNNING)
+                    )
+                    conn.commit()
+                finally:
+                    conn.close()
+                break
+            except sqlite3.Error as e:
+                # Still RUNNING; with the heartbeat stopped, sweep() requeues it
+                print(f"Job {job_id}: recording {status} failed ({attempt + 1}/{JOB_FINISH_ATTEMPTS}): {e}")
+                time.sleep(0.5 * (attempt + 1))
+        else:
+            return
+        shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+
+    def _claim(self):
+        """Atomically move the oldest queued job to running"""
+        conn = self._connect()
+        try:
+            while True:
+                row = conn.execute(
+                    'SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1', (QUEUED,)
+                ).fetchone()
+                if row is None:
+                    return None
+                cur = conn.execute(
+                    'UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? '
+                    'WHERE id = ? AND status = ?',
+                    (RUNNING, time.time(), row['id'], QUEUED)
+                )
+                conn.commit()
+                if cur.rowcount:
+                    return row
+                # Another thread/worker got it first
+        finally:
+            conn.close()
+
+    def sweep(self):
+        """Requeue jobs whose worker died; drop expired jobs and their inputs"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                'UPDATE jobs SET status = ?, updated_at = ? '
+                'WHERE status = ? AND updated_at < ? AND attempts < ?',
+                (QUEUED, now, RUNNING, now - JOB_STALE, JOB_MAX_ATTEMPTS)
+            )
+            conn.execute(
+                'UPDATE jobs SET status = ?, error = ?, updated_at = ?, finished_at = ? '
+                'WHERE status = ? AND updated_at < ?',
+                (FAILED, 'Job worker stopped responding', now, now, RUNNING, now - JOB_STALE)
+            )
+            expired = [row['id'] for row in conn.execute(
+                'SELECT id FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?',
+                (now - self.ttl,)
+            )]
+            conn.executemany('DELETE FROM jobs WHERE id = ?', [(job_id,) for job_id in expired])
+            conn.commit()
+        finally:
+            conn.close()
+        for job_id in expired:
+            shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+        self._last_sweep = now
+
+    # --- job threads ---
+
+    def start(self):
+        """Start this process's job threads (idempotent, fork-aware)"""
+        with self._lock:
+            if self._threads_pid == os.getpid():
+                return
+            self._threads_pid = os.getpid()
+            self._wake = threading.Event()
+            for i in range(self.workers):
+                threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                if time.time() - self._last_sweep > 60:
+                    self.sweep()
+                row = self._claim()
+            except sqlite3.Error:
+                row = None
+            if row is None:
+                # Other workers' submissions are picked up by polling
+                self._wake.wait(1.0)
+                self._wake.clear()
+                continue
+            try:
+                self._execute(row)
+            except Exception as e:
+                # Never let one job take this thread down with it
+                print(f"Job {row['id']}: worker error: {e}")
+
+    def _heartbeat(self, job_id, stop):
+        """Keep a running job's updated_at fresh, so a long single step
+        (one huge file, a merge) isn't mistaken for a dead worker"""
+        while not stop.wait(JOB_STALE / 3.0):
+            try:
+                conn = self._connect()
+                try:
+                    conn.execute('UPDATE jobs SET updated_at = ? WHERE id = ? AND status = ?',
+                                 (time.time(), job_id, RUNNING))
+                    conn.commit()
+                finally:
+                    conn.close()
+            except sqlite3.Error:
+                pass
+
+    def _execute(self, row):
+        job = Job(self, row)
+        stop = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(job.id, stop),
+                         name=f'job-heartbeat-{job.id}', daemon=True).start()
+        try:
+            results = _handlers[job.kind](job)
+        except JobCancelled:
+            shutil.rmtree(self.job_dir(job.id), ignore_errors=True)
+            return
+        except Exception as e:
+            self._finish(job.id, FAILED, error=str(e))
+            return
+        finally:
+            stop.set()
+        self._finish(job.id, DONE, results=results)
+
+
+# Per-worker handle on the shared queue
+job_queue = JobQueue()
@@ -0,0 +1,95 @@
+"""
+Schema migrations for the models database
+
+db.create_all() only creates missing tables; it never touches a table that
+already exists, so new indexes (or columns) never reach a deployed
+database. Migrations here fill that gap: each is a named function that
+runs once, in its own transaction, and is recorded in schema_migrations.
+migrate() runs at start-up (application.init_databases, from gunicorn's
+when_ready) and from `flask --app application db-migrate`, never on import.
+
+Migrations must be idempotent (CREATE INDEX IF NOT EXISTS ...): on a fresh
+database create_all() has already built the current schema, and several
+workers may race to apply the same step.
+"""
+
+from datetime import datetime
+
+import click
+from sqlalchemy import text, exc
+
+from models_api import db
+
+SCHEMA_MIGRATIONS = '''CREATE TABLE IF NOT EXISTS schema_migrations (
+    version VARCHAR(100) PRIMARY KEY,
+    applied_at TIMESTAMP NOT NULL
+)'''
+
+# (version, function) in the order they apply
+MIGRATIONS = []
+
+
+def migration(version):
+    def register(fn):
+        MIGRATIONS.append((version, fn))
+        return fn
+    return register
+
+
+@migration('0001_api_lookup_indexes')
+def api_lookup_indexes(conn):
+    """Indexes for the dashboard/auth key lookups and per-key usage scans"""
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_api_keys_email ON api_keys (email)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_api_keys_user_id ON api_keys (user_id)'))
+    # Covers the stats range scans (status, processing_time read from the
+    # index) and the newest-first usage history; replaces the plain
+    # (api_key_id, created_at) index
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_api_usage_key_created_cover '
+                      'ON api_usage (api_key_id, created_at, status, processing_time)'))
+    conn.execute(text('DROP INDEX IF EXISTS ix_api_usage_key_created'))
+
+
+def applied_versions(conn):
+    return {row[0] for row in conn.execute(text('SELECT version FROM schema_migrations'))}
+
+
+def migrate(engine, log=print):
+    """Apply pending migrations; returns the versions applied here"""
+    with engine.begin() as conn:
+        conn.execute(text(SCHEMA_MIGRATIONS))
+
+    applied = []
+    for version, fn in MIGRATIONS:
+        try:
+            with engine.begin() as conn:
+                if version in applied_versions(conn):
+                    continue
+                fn(conn)
+                conn.execute(text('INSERT INTO schema_migrations (version, applied_at) '
+                                  'VALUES (:version, :applied_at)'),
+                             {'version': version, 'applied_at': datetime.utcnow()})
+        except exc.IntegrityError:
+            # Another worker recorded it first; the steps are idempotent
+            continue
+        applied.append(version)
+        log(f"schema migration applied: {version}")
+    return applied
+
+
+def register_cli(app, init=None):
+    """`init` does the app's start-up database work (tables, then
+    migrate()) and returns the versions applied; defaults to migrate()"""
+    @app.cli.command('db-migrate')
+    @click.option('--status', is_flag=True, help='List migrations without applying them')
+    def db_migrate_command(status):
+        """Apply pending schema migrations"""
+        if status:
+            with db.engine.connect() as conn:
+                conn.execute(text(SCHEMA_MIGRATIONS))
+                done = applied_versions(conn)
+            for version, _ in MIGRATIONS:
+                click.echo(f"{'applied' if version in done else 'pending'}  {version}")
+            return
+        applied = init() if init else migrate(db.engine)
+        if not applied:
+            click.echo('schema is up to date')
@@ -0,0 +1,133 @@
+"""
+Process pool for CPU-heavy image work
+
+One pool per gunicorn worker, started at worker boot (see gunicorn.conf.py)
+and shared by all of that worker's request threads. Batches fan out with a
+per-request cap on in-flight tasks and come back in submission order.
+"""
+
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# Workers per gunicorn process; defaults to an even split of the cores across
+# WEB_CONCURRENCY, which the Dockerfile / systemd unit also pass as --workers
+_web_workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+POOL_WORKERS = int(os.getenv('IMAGE_POOL_WORKERS', max(1, (os.cpu_count() or 1) // max(1, _web_workers))))
+# In-flight tasks a single request may hold, so one batch can't starve others
+MAX_IN_FLIGHT = int(os.getenv('IMAGE_POOL_MAX_IN_FLIGHT', '4'))
+# Stay under gunicorn's --timeout 120
+BATCH_TIMEOUT = float(os.getenv('IMAGE_POOL_BATCH_TIMEOUT', '100'))
+
+_pool = None
+_pool_pid = None
+_lock = threading.Lock()
+
+
+class BatchCancelled(Exception):
+    """Raised when a batch is abandoned (client gone or deadline passed)"""
+
+
+def _noop():
+    return os.getpid()
+
+
+def _context():
+    # forkserver children start from a clean process instead of a copy of a
+    # threaded gunicorn worker (with onnxruntime/rembg state loaded)
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context('forkserver')
+        ctx.set_forkserver_preload(['services.image_pipeline'])
+        return ctx
+    return multiprocessing.get_context('spawn')
+
+
+def get_pool():
+    """Return this process's pool, creating it after a fork if needed"""
+    global _pool, _pool_pid
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=POOL_WORKERS, mp_context=_context())
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def warm_up():
+    """Start every pool process now rather than on the first request"""
+    pool = get_pool()
+    for future in [pool.submit(_noop) for _ in range(POOL_WORKERS)]:
+        future.result()
+
+
+def shutdown():
+    global _pool
+    with _lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def client_disconnected(environ):
+    """True if the client behind this WSGI request has closed its socket"""
+    sock = environ.get('gunicorn.socket')
+    if sock is None:
+        return False
+    try:
+        return sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b''
+    except BlockingIOError:
+        return False
+    except OSError:
+        return True
+
+
+def map_ordered(fn, arg_list, max_in_flight=MAX_IN_FLIGHT, is_cancelled=None,
+                timeout=BATCH_TIMEOUT, on_result=None):
+    """
+    Run fn(*args) for each args tuple on the pool; return results in order.
+
+    At most `max_in_flight` tasks are queued at a time. `is_cancelled` is
+    polled while waiting; when it returns True, or `timeout` passes, the
+    remaining tasks are cancelled and BatchCancelled is raised.
+    `on_result(index, result)` is called as each task completes.
+    """
+    if len(arg_list) <= 1:
+        # Not worth the IPC round-trip
+        results = []
+        for index, args in enumerate(arg_list):
+            results.append(fn(*args))
+            if on_result is not None:
+                on_result(index, results[-1])
+        return results
+
+    pool = get_pool()
+    deadline = time.monotonic() + timeout
+    results = [None] * len(arg_list)
+    pending = {}
+    next_index = 0
+
+    try:
+        while next_index < len(arg_list) or pending:
+            while next_index < len(arg_list) and len(pending) < max_in_flight:
+                future = pool.submit(fn, *arg_list[next_index])
+                pending[future] = next_index
+                next_index += 1
+
+            done, _ = wait(pending, timeout=0.25, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                results[index] = future.result()
+                if on_result is not None:
+                    on_result(index, results[index])
+
+            if is_cancelled is not None and is_cancelled():
+                raise BatchCancelled('client disconnected')
+            if time.monotonic() > deadline:
+                raise BatchCancelled('batch timed out')
+    finally:
+        for future in pending:
+            future.cancel()
+
+    return results
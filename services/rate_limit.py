@@ -0,0 +1,175 @@
+"""
+Per-key rate limiting - token buckets, no database on the hot path
+
+Each API key gets a bucket holding up to `requests_per_minute` tokens that
+refills continuously at requests_per_minute / 60 per second; a request
+spends one token. Buckets live either in process memory ('memory') or in a
+small mmap'd hash table under /tmp that every gunicorn worker maps
+('mmap', the default where fcntl is available), so all workers share one
+set of counters. Either way a check is O(1) with no SQL.
+"""
+
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: per-process buckets only
+    fcntl = None
+
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'mmap' if fcntl else 'memory')
+RATE_LIMIT_FILE = os.getenv('RATE_LIMIT_FILE', '/tmp/uploads/ratelimit.bin')
+RATE_LIMIT_SLOTS = int(os.getenv('RATE_LIMIT_SLOTS', '8192'))
+
+# Memory backend: idle (full) buckets are pruned past this many keys
+MAX_LOCAL_KEYS = 50_000
+
+
+def _refill(tokens, last, now, per_minute):
+    """Tokens in a bucket last seen at `last`, as of `now`"""
+    return min(float(per_minute), tokens + (now - last) * per_minute / 60.0)
+
+
+def _decide(tokens, per_minute, cost):
+    """(allowed, tokens left, seconds until `cost` tokens are available)"""
+    if tokens >= cost:
+        return True, tokens - cost, 0.0
+    return False, tokens, (cost - tokens) * 60.0 / per_minute
+
+
+class MemoryBuckets:
+    """Buckets in this process only"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, per_minute, cost=1, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            tokens, last = self._buckets.get(key, (float(per_minute), now))
+            tokens = _refill(tokens, last, now, per_minute)
+            allowed, tokens, wait = _decide(tokens, per_minute, cost)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > MAX_LOCAL_KEYS:
+                self._prune_locked(now)
+        return allowed, tokens, wait
+
+    def _prune_locked(self, now):
+        # A bucket idle for a minute is full again - same as never seen
+        stale = [k for k, (_, last) in self._buckets.items() if now - last > 60]
+        for k in stale:
+            del self._buckets[k]
+
+
+class SharedBuckets:
+    """
+    Buckets in an mmap'd open-addressing table shared by all workers.
+
+    Slot layout: 8-byte key fingerprint, tokens (double), last refill
+    (double). Updates hold an flock on the file, which covers other
+    processes, plus a thread lock for threads of this one.
+    """
+
+    SLOT = struct.Struct('<Qdd')
+    PROBES = 8
+
+    def __init__(self, path=RATE_LIMIT_FILE, slots=RATE_LIMIT_SLOTS):
+        self.path = path
+        self.slots = slots
+        self._map = None
+        self._fd = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        if self._pid == os.getpid():
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        size = self.slots * self.SLOT.size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        self._fd = fd
+        self._map = mmap.mmap(fd, size)
+        self._pid = os.getpid()
+
+    @staticmethod
+    def fingerprint(key):
+        # Never 0, which marks an empty slot
+        return (zlib.crc32(key.encode()) << 32 | zlib.adler32(key.encode())) or 1
+
+    def take(self, key, per_minute, cost=1, now=None):
+        now = time.time() if now is None else now
+        fp = self.fingerprint(key)
+        start = fp % self.slots
+        with self._lock:
+            self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                slot, free, oldest, oldest_last = None, None, None, math.inf
+                for probe in range(self.PROBES):
+                    index = (start + probe) % self.slots
+                    slot_fp, tokens, last = self.SLOT.unpack_from(self._map, index * self.SLOT.size)
+                    if slot_fp == fp:
+                        slot = index
+                        break
+                    if free is None and (slot_fp == 0 or now - last > 60):
+                        # Empty, or idle long enough to be a full bucket anyway
+                        free = index
+                    if last < oldest_last:
+                        oldest, oldest_last = index, last
+                if slot is None:
+                    # New key: first free slot, else recycle the least recent
+                    slot = free if free is not None else oldest
+                    tokens, last = float(per_minute), now
+
+                tokens = _refill(tokens, last, now, per_minute)
+                allowed, tokens, wait = _decide(tokens, per_minute, cost)
+                self.SLOT.pack_into(self._map, slot * self.SLOT.size, fp, tokens, now)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return allowed, tokens, wait
+
+
+class RateLimiter:
+    """Facade picking the backend; `check` is what the endpoints call"""
+
+    def __init__(self, backend=RATE_LIMIT_BACKEND):
+        self.backend = backend if fcntl or backend == 'memory' else 'memory'
+        self.buckets = SharedBuckets() if self.backend == 'mmap' else MemoryBuckets()
+
+    def check(self, key, per_minute, cost=1):
+        """
+        Spend `cost` tokens from `key`'s bucket.
+
+        Returns a dict with `allowed`, `limit`, `remaining` and
+        `retry_after` (whole seconds, 0 when allowed).
+        """
+        per_minute = max(1, int(per_minute or 1))
+        allowed, tokens, wait = self.buckets.take(key, per_minute, cost)
+        return {
+            'allowed': allowed,
+            'limit': per_minute,
+            'remaining': int(tokens),
+            'retry_after': 0 if allowed else max(1, math.ceil(wait)),
+        }
+
+
+def rate_limit_headers(result):
+    headers = {
+        'X-RateLimit-Limit': str(result['limit']),
+        'X-RateLimit-Remaining': str(result['remaining']),
+    }
+    if not result['allowed']:
+        headers['Retry-After'] = str(result['retry_after'])
+    return headers
+
+
+# Per-worker handle (the mmap backend shares state across workers)
+rate_limiter = RateLimiter()
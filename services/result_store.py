@@ -0,0 +1,203 @@
+"""
+Result Store - short-lived, size-bounded storage for generated files
+
+Outputs are kept in memory under opaque IDs and evicted least-recently-used
+once the byte budget is exceeded. Results that need a download URL are also
+persisted once to disk, so any gunicorn worker can serve them and they
+survive eviction from this worker's memory tier. The disk copies have their
+own byte budget, trimmed oldest-first, and expire after the TTL; sweep()
+runs at start-up (gunicorn when_ready) and at most once a minute from
+put()/get().
+"""
+
+import os
+import re
+import secrets
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+RESULT_STORE_MAX_BYTES = int(os.getenv('RESULT_STORE_MAX_MB', '128')) * 1024 * 1024
+RESULT_STORE_DISK_BYTES = int(os.getenv('RESULT_STORE_DISK_MB', '512')) * 1024 * 1024
+RESULT_STORE_TTL = int(os.getenv('RESULT_STORE_TTL', '3600'))  # seconds
+RESULT_STORE_DIR = os.getenv('RESULT_STORE_DIR', '/tmp/uploads/results')
+
+_KEY_RE = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+
+class ResultStore:
+    """Bounded LRU of generated files with an optional on-disk copy"""
+
+    def __init__(self, max_bytes=RESULT_STORE_MAX_BYTES, ttl=RESULT_STORE_TTL,
+                 root=RESULT_STORE_DIR, disk_bytes=RESULT_STORE_DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.disk_bytes = disk_bytes
+        self.ttl = ttl
+        self.root = root
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._disk_used = None
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    @staticmethod
+    def valid_key(key):
+        return bool(key) and bool(_KEY_RE.match(key))
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def put(self, data, filename, mime=None, persist=False):
+        """Store `data` and return its opaque key"""
+        key = secrets.token_urlsafe(16)
+        entry = {
+            'data': data,
+            'filename': filename,
+            'mime': mime,
+            'created': time.time(),
+            'persisted': False,
+        }
+
+        if persist:
+            try:
+                os.makedirs(self.root, exist_ok=True)
+                # Write-then-rename so other workers never read a partial file
+                fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, self._path(key))
+                entry['persisted'] = True
+            except OSError:
+                pass
+
+        with self._lock:
+            self._entries[key] = entry
+            self._bytes += len(data)
+            self._evict_locked()
+
+        if entry['persisted']:
+            self._account_disk(len(data))
+        self._maybe_sweep()
+        return key
+
+    def get(self, key):
+        """Return the stored bytes for `key`, or None if unknown/expired"""
+        if not self.valid_key(key):
+            return None
+
+        self._maybe_sweep()
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry['created'] > self.ttl:
+                    self._drop_locked(key)
+                else:
+                    self._entries.move_to_end(key)
+                    return entry['data']
+
+        # Fall back to the disk copy (written by this or another worker)
+        path = self._path(key)
+        try:
+            if now - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def contains(self, key):
+        """Cheap existence check (no disk read)"""
+        if not self.valid_key(key):
+            return False
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry['created'] <= self.ttl:
+                return True
+        try:
+            return now - os.path.getmtime(self._path(key)) <= self.ttl
+        except OSError:
+            return False
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes,
+                    'max_bytes': self.max_bytes, 'disk_bytes': self._disk_used,
+                    'max_disk_bytes': self.disk_bytes}
+
+    def _drop_locked(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= len(entry['data'])
+
+    def _evict_locked(self):
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            self._drop_locked(oldest)
+
+    def _scan_disk(self):
+        files = []
+        try:
+            entries = list(os.scandir(self.root))
+        except OSError:
+            return files
+        for item in entries:
+            try:
+                st = item.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, item.path))
+        return files
+
+    def _account_disk(self, added):
+        with self._lock:
+            if self._disk_used is not None:
+                self._disk_used += added
+                if self._disk_used <= self.disk_bytes:
+                    return
+        self.sweep()
+
+    def _maybe_sweep(self):
+        """sweep(), at most once a minute"""
+        now = time.time()
+        if now - self._last_sweep < 60:
+            return
+        self.sweep(now)
+
+    def sweep(self, now=None):
+        """Drop expired entries, then trim the disk copies oldest-first to
+        the disk budget (other workers share the directory, so from a scan)"""
+        now = now or time.time()
+        self._last_sweep = now
+        with self._lock:
+            expired = [k for k, e in self._entries.items() if now - e['created'] > self.ttl]
+            for key in expired:
+                self._drop_locked(key)
+
+            used = 0
+            kept = []
+            for mtime, size, path in sorted(self._scan_disk()):
+                # Expired copies, and .tmp files from writers that died mid-write
+                if now - mtime > self.ttl:
+                    try:
+                        os.remove(path)
+                        continue
+                    except OSError:
+                        pass
+                kept.append((size, path))
+                used += size
+            if used > self.disk_bytes:
+                for size, path in kept:
+                    if used <= self.disk_bytes * 0.9:
+                        break
+                    try:
+                        os.remove(path)
+                        used -= size
+                    except OSError:
+                        pass
+            self._disk_used = used
+
+
+# Shared per-worker store
+results = ResultStore()
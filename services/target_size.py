@@ -0,0 +1,140 @@
+"""
+Target-size encoder - find the best encode that fits under a byte budget.
+
+Candidates are encoded into io.BytesIO buffers, so a search costs a handful
+of encodes and no disk round-trips. Quality is bisected first (largest
+quality that still fits); if even the lowest quality is too big, the image
+scale is bisected at that quality.
+"""
+
+import io
+from PIL import Image
+
+QUALITY_MIN = 1
+QUALITY_MAX = 100
+MIN_SCALE = 0.1
+SCALE_STEPS = 7  # ~1% precision on the scale factor
+
+# Formats where Pillow honours the `quality` save parameter
+QUALITY_FORMATS = {'JPEG', 'WEBP', 'AVIF'}
+
+
+def format_for_extension(ext, img=None):
+    """Map a file extension ('.jpg') to a Pillow format name ('JPEG')"""
+    fmt = Image.registered_extensions().get(ext.lower())
+    if not fmt and img is not None:
+        fmt = img.format
+    return fmt or 'PNG'
+
+
+def prepare_for_format(img, fmt):
+    """Convert modes the target format can't store (e.g. RGBA -> JPEG)"""
+    if fmt == 'JPEG' and img.mode not in ('RGB', 'L', 'CMYK'):
+        return img.convert('RGB')
+    return img
+
+
+def encode(img, fmt, quality=None):
+    """Encode `img` into bytes with the smallest-output settings for `fmt`"""
+    buf = io.BytesIO()
+    if fmt == 'PNG':
+        img.save(buf, format='PNG', optimize=True, compress_level=9)
+    elif fmt in QUALITY_FORMATS and quality is not None:
+        img.save(buf, format=fmt, quality=quality, optimize=True)
+    else:
+        img.save(buf, format=fmt, optimize=True)
+    return buf.getvalue()
+
+
+def search_quality(img, fmt, target_bytes, lo=QUALITY_MIN, hi=QUALITY_MAX):
+    """
+    Bisect quality in [lo, hi] for the largest value whose encode fits.
+
+    Returns (quality, data) for the best fit, or (None, data) with the
+    lowest-quality encode when nothing fits.
+    """
+    best = None
+    smallest = None
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        data = encode(img, fmt, quality=mid)
+        if len(data) <= target_bytes:
+            best = (mid, data)
+            lo = mid + 1
+        else:
+            if smallest is None or len(data) < len(smallest[1]):
+                smallest = (mid, data)
+            hi = mid - 1
+    if best:
+        return best
+    return None, smallest[1]
+
+
+def search_scale(img, fmt, target_bytes, quality=None):
+    """
+    Bisect the scale factor in [MIN_SCALE, 1) for the largest resize that fits.
+
+    Returns (scaled_image, data) for the best fit, or (None, data) with the
+    MIN_SCALE encode when nothing fits.
+    """
+    lo, hi = MIN_SCALE, 1.0
+    best = None
+    fallback = None
+    for _ in range(SCALE_STEPS):
+        mid = (lo + hi) / 2
+        size = (max(1, int(img.width * mid)), max(1, int(img.height * mid)))
+        candidate = img.resize(size, Image.Resampling.LANCZOS)
+        data = encode(candidate, fmt, quality=quality)
+        if len(data) <= target_bytes:
+            best = (candidate, data)
+            lo = mid
+        else:
+            hi = mid
+    if best:
+        return best
+
+    size = (max(1, int(img.width * MIN_SCALE)), max(1, int(img.height * MIN_SCALE)))
+    candidate = img.resize(size, Image.Resampling.LANCZOS)
+    data = encode(candidate, fmt, quality=quality)
+    if len(data) <= target_bytes:
+        return candidate, data
+    return None, data
+
+
+def fit_to_size(img, fmt, target_bytes):
+    """
+    Encode `img` as `fmt` at or under `target_bytes`, keeping as much quality
+    and resolution as possible.
+
+    Returns a dict with the encoded `data`, the `quality` used (None for
+    lossless formats), the final `width`/`height` and whether the budget was
+    met (`fits`). When nothing fits, `data` is the smallest encode tried.
+    """
+    img = prepare_for_format(img, fmt)
+
+    if fmt in QUALITY_FORMATS:
+        quality, data = search_quality(img, fmt, target_bytes)
+        if quality is not None:
+            return {'data': data, 'quality': quality, 'width': img.width,
+                    'height': img.height, 'fits': True}
+        quality = QUALITY_MIN
+    else:
+        quality = None
+        data = encode(img, fmt)
+        if len(data) <= target_bytes:
+            return {'data': data, 'quality': None, 'width': img.width,
+                    'height': img.height, 'fits': True}
+
+    scaled, scaled_data = search_scale(img, fmt, target_bytes, quality=quality)
+    if scaled is not None:
+        return {'data': scaled_data, 'quality': quality, 'width': scaled.width,
+                'height': scaled.height, 'fits': True}
+
+    # Nothing fits - hand back the smallest encode we produced
+    if len(scaled_data) < len(data):
+        width = max(1, int(img.width * MIN_SCALE))
+        height = max(1, int(img.height * MIN_SCALE))
+        return {'data': scaled_data, 'quality': quality, 'width': width,
+                'height': height, 'fits': False}
+    return {'data': data, 'quality': quality, 'width': img.width,
+            'height': img.height, 'fits': False}
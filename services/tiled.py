@@ -0,0 +1,58 @@
+"""
+Banded resizes for very large images - bounded resampler scratch only
+
+Above TILED_PIXELS, LANCZOS resizes run one band of STRIP_ROWS output rows
+at a time into a preallocated output, so the resampler's scratch buffer no
+longer grows with the image. This is not a streaming pipeline: the source
+is still decoded into one full frame, the output is a full frame encoded in
+one save(), and plain conversions don't take this path at all. Peak memory
+still grows with image area; admission (services/admission.py) costs it so.
+"""
+
+import os
+from PIL import Image
+
+# Images with more pixels than this take the strip path
+TILED_PIXELS = int(os.getenv('TILED_PIXELS', str(24_000_000)))
+# Output rows produced per strip
+STRIP_ROWS = int(os.getenv('TILED_STRIP_ROWS', '256'))
+
+# Modes Pillow resamples with LANCZOS (palette/bilevel fall back to NEAREST)
+STRIP_MODES = {'L', 'LA', 'RGB', 'RGBA', 'CMYK', 'I', 'F'}
+
+def is_large(size):
+    return size[0] * size[1] > TILED_PIXELS
+
+
+def uses_strips(size, mode, target):
+    """True when resizing a `size`/`mode` image to `target` runs in strips"""
+    if not target or not is_large(size) or mode not in STRIP_MODES:
+        return False
+    return target[0] < size[0] or target[1] < size[1]
+
+
+def resize_strips(img, size, reducing_gap=2.0, strip_rows=STRIP_ROWS):
+    """
+    LANCZOS resize to `size`, one horizontal band of output rows at a time.
+    Only the resampler scratch is per band; `img` and the result are full frames.
+
+    Each band reads its source rows through resize(box=...), which includes
+    the filter support around the box, so the seams match a one-shot resize.
+    """
+    if img.mode not in STRIP_MODES:
+        return img.resize(size, Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
+
+    out_width, out_height = size
+    factor = int(min(img.width / out_width, img.height / out_height) / reducing_gap)
+    if factor > 1:
+        # Integer box reduce first - same trade-off as resize(reducing_gap=...)
+        img = img.reduce(factor)
+
+    scale_y = img.height / out_height
+    out = Image.new(img.mode, size)
+    for top in range(0, out_height, strip_rows):
+        bottom = min(top + strip_rows, out_height)
+        band = img.resize((out_width, bottom - top), Image.Resampling.LANCZOS,
+                          box=(0, top * scale_y, img.width, bottom * scale_y))
+        out.paste(band, (0, top))
+    return out
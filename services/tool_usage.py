@@ -0,0 +1,282 @@
+"""
+Tool usage analytics in usage.db - writes off the request path
+
+A page view or a timed API call is a dict update under a lock; a
+background thread per worker flushes everything accumulated every
+TOOL_USAGE_FLUSH_SECONDS in one transaction of executemany upserts:
+
+- tool_usage:   running total and last_seen per path (what /admin/usage
+                has always listed)
+- tool_hits:    hits per path per UTC hour
+- tool_latency: processing-time histogram per path per UTC hour, in
+                log-spaced bins (~20% wide), enough for p50/p95/p99
+
+Rows older than TOOL_HOURLY_DAYS are compacted into one row per day
+(hour = -1) and rows older than TOOL_RETENTION_DAYS are dropped; the
+flusher does this once every TOOL_COMPACT_SECONDS. Pending counts are
+flushed on interpreter exit and from gunicorn's worker_exit hook.
+"""
+
+import atexit
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from services.database import sqlite_connect, local_connection
+
+USAGE_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'usage.db')
+TOOL_USAGE_FLUSH_SECONDS = float(os.getenv('TOOL_USAGE_FLUSH_SECONDS', '5'))
+TOOL_HOURLY_DAYS = int(os.getenv('TOOL_HOURLY_DAYS', '14'))
+TOOL_RETENTION_DAYS = int(os.getenv('TOOL_RETENTION_DAYS', '400'))
+TOOL_COMPACT_SECONDS = 3600
+
+# Latency bin n holds durations in (BIN_BASE**(n-1), BIN_BASE**n] ms
+BIN_BASE = 1.2
+DAILY = -1  # `hour` of a compacted per-day row
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS tool_usage (
+        path TEXT PRIMARY KEY,
+        count INTEGER DEFAULT 0,
+        last_seen TEXT
+    )''',
+    '''CREATE TABLE IF NOT EXISTS tool_hits (
+        path TEXT NOT NULL,
+        day TEXT NOT NULL,
+        hour INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (day, hour, path)
+    ) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS tool_latency (
+        path TEXT NOT NULL,
+        day TEXT NOT NULL,
+        hour INTEGER NOT NULL,
+        bin INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (day, hour, path, bin)
+    ) WITHOUT ROWID''',
+)
+
+UPSERT_SQL = '''INSERT INTO tool_usage (path, count, last_seen) VALUES (?, ?, ?)
+    ON CONFLICT(path) DO UPDATE SET
+        count = count + excluded.count,
+        last_seen = max(coalesce(last_seen, ''), excluded.last_seen)'''
+HITS_SQL = '''INSERT INTO tool_hits (path, day, hour, count) VALUES (?, ?, ?, ?)
+    ON CONFLICT(day, hour, path) DO UPDATE SET count = count + excluded.count'''
+LATENCY_SQL = '''INSERT INTO tool_latency (path, day, hour, bin, count) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(day, hour, path, bin) DO UPDATE SET count = count + excluded.count'''
+
+
+def init_usage_db(db_path=USAGE_DB):
+    conn = sqlite_connect(db_path)
+    for statement in SCHEMA:
+        conn.execute(statement)
+    conn.commit()
+    conn.close()
+
+
+def latency_bin(seconds):
+    ms = max(seconds * 1000.0, 1.0)
+    return math.ceil(math.log(ms, BIN_BASE) - 1e-9)
+
+
+def bin_upper_ms(n):
+    return BIN_BASE ** n
+
+
+class ToolUsageCounter:
+    """Per-worker pending counts plus the thread that flushes them"""
+
+    def __init__(self, db_path=USAGE_DB, flush_seconds=TOOL_USAGE_FLUSH_SECONDS):
+        self.db_path = db_path
+        self.flush_seconds = flush_seconds
+        self._reset()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._compacted = 0.0
+        self.flushes = 0
+        self.failed = 0
+        atexit.register(self.close)
+
+    def _reset(self):
+        self._totals = {}   # path -> [count, last_seen]
+        self._hits = {}     # (path, day, hour) -> count
+        self._latency = {}  # (path, day, hour, bin) -> count
+
+    def _ensure_thread(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Counts inherited from the parent are the parent's to flush
+            self._reset()
+            self._stop = threading.Event()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='tool-usage', daemon=True)
+            self._thread.start()
+
+    def hit(self, path):
+        """Count one page view; never touches the database"""
+        self._ensure_thread()
+        now = datetime.utcnow()
+        stamp = now.isoformat()
+        hour_key = (path, stamp[:10], now.hour)
+        with self._lock:
+            entry = self._totals.get(path)
+            if entry is None:
+                self._totals[path] = [1, stamp]
+            else:
+                entry[0] += 1
+                entry[1] = stamp
+            self._hits[hour_key] = self._hits.get(hour_key, 0) + 1
+
+    def timing(self, path, seconds):
+        """Add one processing time to `path`'s histogram"""
+        self._ensure_thread()
+        now = datetime.utcnow()
+        key = (path, now.strftime('%Y-%m-%d'), now.hour, latency_bin(seconds))
+        with self._lock:
+            self._latency[key] = self._latency.get(key, 0) + 1
+
+    def _run(self):
+        while not self._stop.wait(self.flush_seconds):
+            self.flush()
+            if time.monotonic() - self._compacted > TOOL_COMPACT_SECONDS:
+                self._compacted = time.monotonic()
+                try:
+                    compact(self.db_path)
+                except sqlite3.Error as e:
+                    print(f"Tool usage compaction failed: {e}")
+
+    def flush(self):
+        """Write the accumulated counts in one transaction"""
+        if self._pid != os.getpid():
+            # Nothing counted in this process (a fork's copy isn't ours)
+            return
+        with self._flush_lock:
+            with self._lock:
+                totals, hits, latency = self._totals, self._hits, self._latency
+                self._reset()
+            if not (totals or hits or latency):
+                return
+            try:
+                with local_connection(self.db_path) as conn:
+                    conn.executemany(UPSERT_SQL, [(path, count, last_seen)
+                                                  for path, (count, last_seen) in totals.items()])
+                    conn.executemany(HITS_SQL, [key + (count,) for key, count in hits.items()])
+                    conn.executemany(LATENCY_SQL, [key + (count,) for key, count in latency.items()])
+                self.flushes += 1
+            except sqlite3.Error as e:
+                # Put the counts back for the next attempt
+                self.failed += 1
+                with self._lock:
+                    for path, (count, last_seen) in totals.items():
+                        entry = self._totals.setdefault(path, [0, last_seen])
+                        entry[0] += count
+                        entry[1] = max(entry[1], last_seen)
+                    for key, count in hits.items():
+                        self._hits[key] = self._hits.get(key, 0) + count
+                    for key, count in latency.items():
+                        self._latency[key] = self._latency.get(key, 0) + count
+                print(f"Tool usage flush failed: {e}")
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending_paths': len(self._totals),
+                'pending_buckets': len(self._hits) + len(self._latency),
+                'flushes': self.flushes,
+                'failed': self.failed,
+            }
+
+
+# Per-worker singleton
+tool_usage = ToolUsageCounter()
+
+
+def compact(db_path=USAGE_DB, now=None):
+    """
+    Fold hourly rows older than TOOL_HOURLY_DAYS into per-day rows and drop
+    everything older than TOOL_RETENTION_DAYS. One transaction, re-runnable.
+    """
+    now = now or datetime.utcnow()
+    hourly_before = (now - timedelta(days=TOOL_HOURLY_DAYS)).strftime('%Y-%m-%d')
+    keep_from = (now - timedelta(days=TOOL_RETENTION_DAYS)).strftime('%Y-%m-%d')
+    with local_connection(db_path) as conn:
+        conn.execute('''INSERT INTO tool_hits (path, day, hour, count)
+            SELECT path, day, -1, sum(count) FROM tool_hits
+            WHERE day < ? AND hour >= 0 GROUP BY path, day
+            ON CONFLICT(day, hour, path) DO UPDATE SET count = count + excluded.count''',
+                     (hourly_before,))
+        conn.execute('DELETE FROM tool_hits WHERE day < ? AND hour >= 0', (hourly_before,))
+        conn.execute('''INSERT INTO tool_latency (path, day, hour, bin, count)
+            SELECT path, day, -1, bin, sum(count) FROM tool_latency
+            WHERE day < ? AND hour >= 0 GROUP BY path, day, bin
+            ON CONFLICT(day, hour, path, bin) DO UPDATE SET count = count + excluded.count''',
+                     (hourly_before,))
+        conn.execute('DELETE FROM tool_latency WHERE day < ? AND hour >= 0', (hourly_before,))
+        conn.execute('DELETE FROM tool_hits WHERE day < ?', (keep_from,))
+        conn.execute('DELETE FROM tool_latency WHERE day < ?', (keep_from,))
+
+
+def _percentiles(bins, points=(50, 95, 99)):
+    """{bin: count} -> {'p50': ms, ...} using each bin's upper bound"""
+    total = sum(bins.values())
+    result = {}
+    for p in points:
+        rank, seen = total * p / 100.0, 0
+        for n in sorted(bins):
+            seen += bins[n]
+            if seen >= rank:
+                result[f'p{p}'] = round(bin_upper_ms(n), 1)
+                break
+    return result
+
+
+def tool_report(start, end, granularity=None, db_path=USAGE_DB):
+    """
+    Hits and latency percentiles per path for days start..end (inclusive,
+    'YYYY-MM-DD'). With granularity 'day' or 'hour', each tool also gets a
+    `series` of hit counts (hourly detail only exists for recent days;
+    compacted days show up as hour -1).
+    """
+    conn = local_connection(db_path)
+    tools = {}
+    for path, count in conn.execute(
+            'SELECT path, sum(count) FROM tool_hits WHERE day BETWEEN ? AND ? GROUP BY path',
+            (start, end)):
+        tools[path] = {'path': path, 'hits': count}
+
+    bins = {}
+    for path, n, count in conn.execute(
+            '''SELECT path, bin, sum(count) FROM tool_latency
+               WHERE day BETWEEN ? AND ? GROUP BY path, bin''', (start, end)):
+        bins.setdefault(path, {})[n] = count
+    for path, path_bins in bins.items():
+        entry = tools.setdefault(path, {'path': path, 'hits': 0})
+        entry['timed'] = sum(path_bins.values())
+        entry['latency_ms'] = _percentiles(path_bins)
+
+    if granularity == 'day':
+        rows = conn.execute('''SELECT path, day, sum(count) FROM tool_hits
+            WHERE day BETWEEN ? AND ? GROUP BY path, day ORDER BY day''', (start, end))
+        for path, day, count in rows:
+            tools[path].setdefault('series', []).append({'bucket': day, 'hits': count})
+    elif granularity == 'hour':
+        rows = conn.execute('''SELECT path, day, hour, count FROM tool_hits
+            WHERE day BETWEEN ? AND ? ORDER BY day, hour''', (start, end))
+        for path, day, hour, count in rows:
+            bucket = day if hour == DAILY else f'{day}T{hour:02d}'
+            tools[path].setdefault('series', []).append({'bucket': bucket, 'hits': count})
+    return sorted(tools.values(), key=lambda t: t['hits'], reverse=True)
@@ -0,0 +1,198 @@
+"""
+Usage log writer - APIUsage rows without a commit per request
+
+Requests only enqueue a plain dict. A background thread drains the queue
+and writes whole batches (one executemany INSERT into api_usage, one
+executemany UPDATE of api_keys.last_used per distinct key, and the
+hourly/daily rollup upserts) every USAGE_FLUSH_MS or USAGE_BATCH_ROWS
+rows, whichever comes first. The queue
+is bounded: when it's full, record() blocks for up to
+USAGE_ENQUEUE_TIMEOUT seconds and then drops the row (counted in stats()).
+Pending rows are flushed on interpreter exit and from gunicorn's
+worker_exit hook.
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from flask import request, g
+from sqlalchemy import bindparam
+
+from models_api import db, APIKey, APIUsage
+from services import usage_rollup
+
+USAGE_QUEUE_SIZE = int(os.getenv('USAGE_QUEUE_SIZE', '10000'))
+USAGE_BATCH_ROWS = int(os.getenv('USAGE_BATCH_ROWS', '500'))
+USAGE_FLUSH_MS = int(os.getenv('USAGE_FLUSH_MS', '500'))
+USAGE_ENQUEUE_TIMEOUT = float(os.getenv('USAGE_ENQUEUE_TIMEOUT', '0.05'))
+
+# Columns a record may set; anything else is ignored
+USAGE_FIELDS = (
+    'api_key_id', 'endpoint', 'method', 'message', 'status', 'model_used',
+    'processing_time', 'error_code', 'error_message', 'ip_address', 'user_agent',
+    'created_at',
+)
+
+_STOP = object()
+
+
+class UsageWriter:
+    """Bounded queue of APIUsage rows plus the thread that batches them"""
+
+    def __init__(self, max_rows=USAGE_QUEUE_SIZE, batch_rows=USAGE_BATCH_ROWS,
+                 flush_ms=USAGE_FLUSH_MS, enqueue_timeout=USAGE_ENQUEUE_TIMEOUT):
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_ms / 1000.0
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=max_rows)
+        self._app = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    def init_app(self, app):
+        self._app = app
+        atexit.register(self.close)
+
+    def _ensure_thread(self):
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                # Rows queued in the parent before fork belong to the parent
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='usage-writer', daemon=True)
+            self._thread.start()
+
+    def record(self, **fields):
+        """Queue one APIUsage row; never touches the database"""
+        row = {name: fields.get(name) for name in USAGE_FIELDS}
+        row['id'] = str(uuid.uuid4())
+        row['created_at'] = row['created_at'] or datetime.utcnow()
+        row['method'] = row['method'] or 'POST'
+        row['status'] = row['status'] or 'success'
+        self._ensure_thread()
+        try:
+            self._queue.put(row, timeout=self.enqueue_timeout)
+            return True
+        except queue.Full:
+            # Shed logging, never the request
+            self.dropped += 1
+            return False
+
+    def _run(self):
+        while True:
+            batch = []
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_rows:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            if batch:
+                self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch):
+        last_used = {}
+        for row in batch:
+            key_id = row['api_key_id']
+            if key_id and (key_id not in last_used or row['created_at'] > last_used[key_id]):
+                last_used[key_id] = row['created_at']
+
+        api_keys = APIKey.__table__
+        try:
+            with self._app.app_context():
+                with db.engine.begin() as conn:
+                    conn.execute(APIUsage.__table__.insert(), batch)
+                    usage_rollup.apply(conn, batch)
+                    if last_used:
+                        conn.execute(
+                            api_keys.update()
+                            .where(api_keys.c.id == bindparam('key_id'))
+                            .values(last_used=bindparam('used_at')),
+                            [{'key_id': k, 'used_at': v} for k, v in last_used.items()]
+                        )
+            self.written += len(batch)
+            self.batches += 1
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"Usage log flush failed ({len(batch)} rows): {e}")
+
+    def flush(self, timeout=5.0):
+        """Write everything queued so far (used on shutdown)"""
+        if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+            # No writer thread in this process: drain inline
+            batch = []
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _STOP:
+                    batch.append(item)
+            if batch and self._app is not None:
+                self._write(batch)
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    def close(self):
+        if self._app is not None:
+            self.flush()
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'batches': self.batches,
+            'dropped': self.dropped,
+            'failed': self.failed,
+        }
+
+
+# Per-worker singleton, bound to the app in application.py
+usage_writer = UsageWriter()
+
+
+def record_request(api_key_id, status_code, started, status=None):
+    """Queue a usage row for the current request. Views can add
+    model_used/message/error_message through `g.usage_extra`."""
+    extra = getattr(g, 'usage_extra', None) or {}
+    if status is None:
+        status = 'success' if status_code < 400 else 'error'
+    usage_writer.record(
+        api_key_id=api_key_id,
+        endpoint=request.path,
+        method=request.method,
+        status=status,
+        processing_time=round(time.perf_counter() - started, 4),
+        error_code=str(status_code) if status_code >= 400 else None,
+        ip_address=request.headers.get('X-Forwarded-For', request.remote_addr or '').split(',')[0].strip()[:50],
+        user_agent=(request.user_agent.string or '')[:255],
+        **{k: v for k, v in extra.items() if k in ('model_used', 'message', 'error_message')}
+    )
@@ -0,0 +1,137 @@
+"""
+api_usage retention - per-plan windows, batched deletes, gzip archives
+
+Raw api_usage rows are kept for USAGE_RETENTION_DAYS per plan
+("free=30,premium=90,enterprise=365"; keys of other plans, and rows whose
+key is gone, use the `default` entry). Older rows are removed in batches
+of USAGE_RETENTION_BATCH, each its own short transaction, so the writer
+and the dashboards never wait long on the database. Unless archiving is
+off, each batch is first appended to ARCHIVE_DIR/api_usage-YYYY-MM.jsonl.gz
+(one gzip member per batch, so a file is just a growing stream).
+
+The rollup buckets are brought up to date first (usage_rollup.compact), so
+stats pages keep their history after the raw rows are gone; a plan whose
+cutoff the buckets don't reach yet is skipped rather than purged. Scheduled by
+deploy/usage-retention.timer via `flask --app application usage-retention`.
+"""
+
+import gzip
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import select, func
+
+from models_api import db, APIKey, APIUsage
+from services import usage_rollup
+
+USAGE_RETENTION_DAYS = os.getenv('USAGE_RETENTION_DAYS', 'free=30,premium=90,enterprise=365,default=30')
+USAGE_RETENTION_BATCH = int(os.getenv('USAGE_RETENTION_BATCH', '2000'))
+USAGE_ARCHIVE_DIR = os.getenv('USAGE_ARCHIVE_DIR', '/var/lib/cutcompress/usage-archive')
+
+# Pause between batches so other writers get the lock
+BATCH_PAUSE = 0.05
+
+
+def parse_windows(spec):
+    """'free=30,premium=90' -> {'free': 30, 'premium': 90, 'default': 30}"""
+    windows = {}
+    for part in spec.split(','):
+        if '=' in part:
+            plan, days = part.split('=', 1)
+            windows[plan.strip()] = int(days)
+    windows.setdefault('default', 30)
+    return windows
+
+
+def _expired_conditions(windows, now):
+    """(plan, cutoff, WHERE clauses) for each plan's expired rows"""
+    usage = APIUsage.__table__
+    keys = APIKey.__table__
+    plan = func.coalesce(keys.c.plan, 'free')
+    named = [name for name in windows if name != 'default']
+    conditions = []
+    for name in named:
+        cutoff = now - timedelta(days=windows[name])
+        conditions.append((name, cutoff, usage.c.created_at < cutoff,
+                           usage.c.api_key_id.in_(select(keys.c.id).where(plan == name))))
+    cutoff = now - timedelta(days=windows['default'])
+    conditions.append(('default', cutoff, usage.c.created_at < cutoff,
+                       usage.c.api_key_id.not_in(select(keys.c.id).where(plan.in_(named)))))
+    return conditions
+
+
+def _row_json(row):
+    data = row._asdict()
+    data['created_at'] = data['created_at'].isoformat() if data['created_at'] else None
+    return json.dumps(data, ensure_ascii=False)
+
+
+def _archive(archive_dir, rows):
+    by_month = {}
+    for row in rows:
+        month = row.created_at.strftime('%Y-%m') if row.created_at else 'unknown'
+        by_month.setdefault(month, []).append(_row_json(row))
+    os.makedirs(archive_dir, exist_ok=True)
+    for month, lines in by_month.items():
+        path = os.path.join(archive_dir, f'api_usage-{month}.jsonl.gz')
+        with gzip.open(path, 'at', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+
+def purge(engine, windows=None, archive_dir=USAGE_ARCHIVE_DIR, batch=USAGE_RETENTION_BATCH,
+          dry_run=False, now=None, log=print):
+    """
+    Delete (and archive, unless archive_dir is None) expired api_usage rows.
+    Returns {plan: rows removed}, or rows that would be with dry_run.
+    """
+    windows = windows or parse_windows(USAGE_RETENTION_DAYS)
+    now = now or datetime.utcnow()
+    usage = APIUsage.__table__
+
+    if not dry_run:
+        usage_rollup.compact(engine, now=now, log=log)
+        safe_before = usage_rollup.bucketed_before(engine)
+
+    removed = {}
+    for plan, cutoff, too_old, of_plan in _expired_conditions(windows, now):
+        if dry_run:
+            with engine.connect() as conn:
+                removed[plan] = conn.execute(
+                    select(func.count()).select_from(usage).where(too_old, of_plan)).scalar()
+            continue
+        if cutoff > safe_before:
+            # Stats would still read these rows from api_usage
+            log(f"usage retention: skipping {plan}, rollups only cover rows before {safe_before}")
+            removed[plan] = 0
+            continue
+
+        removed[plan] = 0
+        while True:
+            with engine.begin() as conn:
+                rows = conn.execute(
+                    select(usage).where(too_old, of_plan).order_by(usage.c.created_at).limit(batch)
+                ).all()
+                if not rows:
+                    break
+                if archive_dir:
+                    _archive(archive_dir, rows)
+                conn.execute(usage.delete().where(usage.c.id.in_([row.id for row in rows])))
+            removed[plan] += len(rows)
+            if len(rows) < batch:
+                break
+            time.sleep(BATCH_PAUSE)
+    log(f"usage retention: {'would remove' if dry_run else 'removed'} "
+        + ', '.join(f'{plan}={count}' for plan, count in removed.items()))
+    return removed
+
+
+def register_cli(app):
+    @app.cli.command('usage-retention')
+    @click.option('--dry-run', is_flag=True, help='Only count the rows that would go')
+    @click.option('--no-archive', is_flag=True, help='Delete without writing JSONL archives')
+    def usage_retention_command(dry_run, no_archive):
+        """Archive and delete api_usage rows past their plan's retention window"""
+        purge(db.engine, archive_dir=None if no_archive else USAGE_ARCHIVE_DIR, dry_run=dry_run)
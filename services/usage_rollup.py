@@ -0,0 +1,209 @@
+"""
+Usage rollups - hourly and daily api_usage buckets
+
+Every batch the usage writer inserts into api_usage is also folded into
+api_usage_hourly and api_usage_daily (per key, endpoint, status and model:
+a request count and a processing-time sum), in the same transaction, as
+additive upserts. The stats pages then read a few bucket rows instead of
+scanning raw logs.
+
+Rows logged before rollups existed are folded in by compact(), a day at a
+time. `live_since` marks where the writer took over and `backfilled_until`
+how far compact() has got, so no row is ever counted twice. compact() also
+drops hourly buckets older than ROLLUP_HOURLY_DAYS; daily buckets are kept.
+Run it with `flask --app application usage-rollup` (the retention job runs
+it before deleting raw rows).
+"""
+
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func, and_, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models_api import db, APIUsage, APIUsageHourly, APIUsageDaily, UsageRollupState
+
+ROLLUP_HOURLY_DAYS = int(os.getenv('ROLLUP_HOURLY_DAYS', '8'))
+
+# Longest stats window served from hourly buckets; longer ones use daily.
+# Must stay below ROLLUP_HOURLY_DAYS.
+HOURLY_WINDOW_HOURS = 168
+
+BUCKET_DIMENSIONS = ('api_key_id', 'bucket_start', 'endpoint', 'status', 'model_used')
+
+
+def floor_hour(when):
+    return when.replace(minute=0, second=0, microsecond=0)
+
+
+def floor_day(when):
+    return when.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+# table model -> bucket_start for a timestamp
+GRANULARITIES = ((APIUsageHourly, floor_hour), (APIUsageDaily, floor_day))
+
+
+def bucket_deltas(rows):
+    """
+    Fold api_usage row dicts into {model: [bucket row dict, ...]}, one
+    entry per distinct bucket, ready to add onto the bucket tables.
+    """
+    deltas = {}
+    for model, floor in GRANULARITIES:
+        buckets = {}
+        for row in rows:
+            key = (row['api_key_id'], floor(row['created_at']), row['endpoint'] or '',
+                   row['status'] or 'success', row['model_used'] or '')
+            count, seconds = buckets.get(key, (0, 0.0))
+            buckets[key] = (count + 1, seconds + (row['processing_time'] or 0))
+        deltas[model] = [
+            dict(zip(BUCKET_DIMENSIONS, key), requests=count, time_sum=seconds)
+            for key, (count, seconds) in buckets.items()
+        ]
+    return deltas
+
+
+def _upsert(conn, model, rows):
+    """Add `rows` onto existing buckets, creating missing ones"""
+    table = model.__table__
+    dialect = conn.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = (sqlite if dialect == 'sqlite' else postgresql).insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(BUCKET_DIMENSIONS),
+            set_={
+                'requests': table.c.requests + stmt.excluded.requests,
+                'time_sum': table.c.time_sum + stmt.excluded.time_sum,
+            }
+        )
+        conn.execute(stmt, rows)
+        return
+
+    # Other databases: update, then insert whatever wasn't there
+    for row in rows:
+        match = and_(*(table.c[name] == row[name] for name in BUCKET_DIMENSIONS))
+        result = conn.execute(update(table).where(match).values(
+            requests=table.c.requests + row['requests'],
+            time_sum=table.c.time_sum + row['time_sum'],
+        ))
+        if result.rowcount == 0:
+            conn.execute(table.insert(), row)
+
+
+def apply(conn, rows):
+    """Fold freshly inserted api_usage rows into the buckets (caller's transaction)"""
+    for model, buckets in bucket_deltas(rows).items():
+        if buckets:
+            _upsert(conn, model, buckets)
+
+
+def _get_state(conn, name):
+    table = UsageRollupState.__table__
+    return conn.execute(select(table.c.value).where(table.c.name == name)).scalar()
+
+
+def _set_state(conn, name, value):
+    table = UsageRollupState.__table__
+    if conn.execute(update(table).where(table.c.name == name).values(value=value)).rowcount == 0:
+        conn.execute(table.insert(), {'name': name, 'value': value})
+
+
+def start(engine):
+    """
+    Record when the writer started rolling up (first start only). Called
+    from application.init_databases before any worker serves a request, so
+    every row the writer logs is newer.
+    """
+    with engine.begin() as conn:
+        if _get_state(conn, 'live_since') is None:
+            _set_state(conn, 'live_since', datetime.utcnow())
+
+
+class _Coverage:
+    """Whether buckets hold every row since a given time; cached once complete"""
+
+    def __init__(self):
+        self.complete = False
+
+    def covers(self, since):
+        if self.complete:
+            return True
+        with db.engine.connect() as conn:
+            live_since = _get_state(conn, 'live_since')
+            backfilled = _get_state(conn, 'backfilled_until')
+        if live_since is None:
+            return False
+        if backfilled is not None and backfilled >= live_since:
+            self.complete = True
+            return True
+        return since >= live_since
+
+
+coverage = _Coverage()
+
+
+def bucketed_before(engine):
+    """Every api_usage row older than this is already in the buckets"""
+    with engine.connect() as conn:
+        live_since = _get_state(conn, 'live_since')
+        backfilled = _get_state(conn, 'backfilled_until')
+    if live_since is not None and backfilled is not None:
+        return datetime.max if backfilled >= live_since else backfilled
+    return datetime.min
+
+
+def compact(engine, now=None, log=print):
+    """
+    Fold pre-rollup api_usage rows into the buckets, one day per
+    transaction, then prune old hourly buckets. Safe to re-run.
+    """
+    now = now or datetime.utcnow()
+    usage = APIUsage.__table__
+    columns = [usage.c[name] for name in
+               ('api_key_id', 'endpoint', 'status', 'model_used', 'processing_time', 'created_at')]
+
+    with engine.connect() as conn:
+        live_since = _get_state(conn, 'live_since')
+        done = _get_state(conn, 'backfilled_until')
+        if done is None:
+            oldest = conn.execute(select(func.min(usage.c.created_at))).scalar()
+            done = floor_day(oldest) if oldest is not None else live_since
+
+    folded = 0
+    while live_since is not None and done < live_since:
+        until = min(done + timedelta(days=1), live_since)
+        with engine.begin() as conn:
+            rows = [row._asdict() for row in conn.execute(
+                select(*columns).where(usage.c.created_at >= done, usage.c.created_at < until)
+            )]
+            apply(conn, rows)
+            _set_state(conn, 'backfilled_until', until)
+        folded += len(rows)
+        done = until
+    if live_since is not None:
+        with engine.begin() as conn:
+            if _get_state(conn, 'backfilled_until') is None and conn.execute(
+                    select(func.count()).select_from(usage)
+                    .where(usage.c.created_at < live_since)).scalar() == 0:
+                # Nothing predates the writer (empty table, or only newer
+                # rows): the buckets are complete as they stand
+                _set_state(conn, 'backfilled_until', live_since)
+    if folded:
+        log(f"usage rollup: folded {folded} rows logged before {live_since}")
+
+    hourly = APIUsageHourly.__table__
+    cutoff = floor_day(now) - timedelta(days=ROLLUP_HOURLY_DAYS)
+    with engine.begin() as conn:
+        pruned = conn.execute(hourly.delete().where(hourly.c.bucket_start < cutoff)).rowcount
+    if pruned:
+        log(f"usage rollup: pruned {pruned} hourly buckets before {cutoff}")
+    return {'folded': folded, 'pruned_hourly': pruned}
+
+
+def register_cli(app):
+    @app.cli.command('usage-rollup')
+    def usage_rollup_command():
+        """Fold pre-rollup api_usage rows into buckets and prune hourly buckets"""
+        compact(db.engine)
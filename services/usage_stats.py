@@ -0,0 +1,149 @@
+"""
+Usage stats - aggregates computed in SQL
+
+Every number on the stats pages comes from COUNT/SUM over api_usage,
+grouped by status or model_used, so the database returns a handful of
+rows however many requests a key has made. Once the rollup buckets
+(services/usage_rollup.py) cover a window it is read from them; until then
+from api_usage, whose range scans are served by the (api_key_id,
+created_at, status, processing_time) covering index declared on APIUsage.
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, func
+
+from models_api import db, APIUsage, APIUsageHourly, APIUsageDaily
+from services.usage_rollup import coverage, floor_hour, floor_day, HOURLY_WINDOW_HOURS
+
+# Windows shown on the key stats page (label -> hours)
+STATS_PERIODS = {'24h': 24, '7d': 168, '30d': 720}
+
+
+def _summary(by_status):
+    """{status: (count, time_sum)} -> the dict get_usage_stats always returned"""
+    total = sum(count for count, _ in by_status.values())
+    time_sum = sum(seconds or 0 for _, seconds in by_status.values())
+    return {
+        'total_requests': total,
+        'successful': by_status.get('success', (0, 0))[0],
+        'failed': by_status.get('error', (0, 0))[0],
+        'avg_processing_time': time_sum / total if total else 0
+    }
+
+
+def _raw_windows(key_id, cutoffs):
+    """{label: {status: (count, time_sum)}} from api_usage itself"""
+    columns = [APIUsage.status]
+    for cutoff in cutoffs.values():
+        in_window = APIUsage.created_at >= cutoff
+        columns.append(func.sum(case((in_window, 1), else_=0)))
+        columns.append(func.sum(case((in_window, func.coalesce(APIUsage.processing_time, 0)), else_=0)))
+
+    rows = db.session.query(*columns).filter(
+        APIUsage.api_key_id == key_id,
+        APIUsage.created_at >= min(cutoffs.values())
+    ).group_by(APIUsage.status).all()
+    return _by_window(rows, cutoffs)
+
+
+def _bucket_windows(model, key_id, cutoffs):
+    """Same as _raw_windows, from one of the rollup tables"""
+    columns = [model.status]
+    for cutoff in cutoffs.values():
+        in_window = model.bucket_start >= cutoff
+        columns.append(func.sum(case((in_window, model.requests), else_=0)))
+        columns.append(func.sum(case((in_window, model.time_sum), else_=0)))
+
+    rows = db.session.query(*columns).filter(
+        model.api_key_id == key_id,
+        model.bucket_start >= min(cutoffs.values())
+    ).group_by(model.status).all()
+    return _by_window(rows, cutoffs)
+
+
+def _by_window(rows, cutoffs):
+    return {
+        label: {row[0]: (row[1 + 2 * i] or 0, row[2 + 2 * i]) for row in rows}
+        for i, label in enumerate(cutoffs)
+    }
+
+
+def period_stats(key_id, periods=STATS_PERIODS):
+    """
+    usage_stats() for several windows, each window one conditional
+    COUNT/SUM in a single grouped query.
+
+    Served from the rollup buckets once they cover the window: hourly
+    buckets up to HOURLY_WINDOW_HOURS, daily beyond. Windows then start at
+    the bucket boundary, so they can include up to one extra hour/day.
+    """
+    now = datetime.utcnow()
+    cutoffs = {label: now - timedelta(hours=hours) for label, hours in periods.items()}
+    if not coverage.covers(min(cutoffs.values())):
+        by_window = _raw_windows(key_id, cutoffs)
+        return {label: _summary(by_window[label]) for label in cutoffs}
+
+    hourly = {label: floor_hour(cutoffs[label]) for label, hours in periods.items()
+              if hours <= HOURLY_WINDOW_HOURS}
+    daily = {label: floor_day(cutoffs[label]) for label in cutoffs if label not in hourly}
+    by_window = {}
+    if hourly:
+        by_window.update(_bucket_windows(APIUsageHourly, key_id, hourly))
+    if daily:
+        by_window.update(_bucket_windows(APIUsageDaily, key_id, daily))
+    return {label: _summary(by_window[label]) for label in cutoffs}
+
+
+def usage_stats(key_id, hours=24):
+    """Request counts and average processing time for one key over `hours`"""
+    return period_stats(key_id, {'window': hours})['window']
+
+
+def bulk_usage_stats(key_ids, hours=24):
+    """
+    usage_stats() for many keys in one query grouped by (key, status).
+    Returns {key_id: stats}; keys with no traffic get zeroed stats.
+    """
+    key_ids = list(key_ids)
+    if not key_ids:
+        return {}
+    cutoff = datetime.utcnow() - timedelta(hours=hours)
+    if coverage.covers(cutoff):
+        model = APIUsageHourly if hours <= HOURLY_WINDOW_HOURS else APIUsageDaily
+        floor = floor_hour if model is APIUsageHourly else floor_day
+        rows = db.session.query(
+            model.api_key_id, model.status,
+            func.sum(model.requests), func.sum(model.time_sum)
+        ).filter(
+            model.api_key_id.in_(key_ids),
+            model.bucket_start >= floor(cutoff)
+        ).group_by(model.api_key_id, model.status).all()
+    else:
+        rows = db.session.query(
+            APIUsage.api_key_id, APIUsage.status,
+            func.count(APIUsage.id), func.sum(func.coalesce(APIUsage.processing_time, 0))
+        ).filter(
+            APIUsage.api_key_id.in_(key_ids),
+            APIUsage.created_at >= cutoff
+        ).group_by(APIUsage.api_key_id, APIUsage.status).all()
+
+    by_key = {key_id: {} for key_id in key_ids}
+    for key_id, status, count, seconds in rows:
+        by_key[key_id][status] = (count or 0, seconds)
+    return {key_id: _summary(by_status) for key_id, by_status in by_key.items()}
+
+
+def model_usage(key_id):
+    """All-time request count per model_used"""
+    if coverage.covers(datetime.min):
+        rows = db.session.query(APIUsageDaily.model_used, func.sum(APIUsageDaily.requests)).filter(
+            APIUsageDaily.api_key_id == key_id,
+            APIUsageDaily.model_used != ''
+        ).group_by(APIUsageDaily.model_used).all()
+    else:
+        rows = db.session.query(APIUsage.model_used, func.count(APIUsage.id)).filter(
+            APIUsage.api_key_id == key_id,
+            APIUsage.model_used.isnot(None)
+        ).group_by(APIUsage.model_used).all()
+    return {model: count for model, count in rows}
@@ -107,7 +107,8 @@ convertBtn?.addEventListener('click', () => {
           name: file.name.replace(/\.[^/.]+$/, '.jpg'),
           size: data.size,
           pixels: data.pixels,
-          url: data.url
+          url: data.url,
+          id: data.id
         };
       })
       .catch(() => {
@@ -205,15 +206,21 @@ function downloadSingle(url, name) {
 
 // Download ZIP
 downloadZipBtn?.addEventListener('click', () => {
-  const files = convertedImages.filter(Boolean).map(img => img.url);
-  if (!files.length) return;
+  const ids = convertedImages.filter(Boolean).map(img => img.id);
+  if (!ids.length) return;
 
   fetch('/api/image-to-jpg-zip', {
     method: 'POST',
     headers: { 'Content-Type':'application/json' },
-    body: JSON.stringify({ files })
+    body: JSON.stringify({ ids })
+  })
+  .then(res => {
+    if (res.ok) return res.blob();
+    // Expired results come back as a 410 with a JSON error, not a ZIP
+    return res.json().catch(() => ({})).then(err => {
+      throw new Error(err.error || 'Download failed');
+    });
   })
-  .then(res => res.blob())
   .then(blob => {
     const a = document.createElement('a');
     a.href = URL.createObjectURL(blob);
@@ -222,5 +229,6 @@ downloadZipBtn?.addEventListener('click', () => {
     a.click();
     document.body.removeChild(a);
     URL.revokeObjectURL(a.href);
-  });
+  })
+  .catch(err => alert('Error: ' + err.message));
 });
\ No newline at end of file
@@ -39,7 +39,7 @@ convertBtn?.addEventListener('click', ()=>{
     const fd=new FormData(); fd.append('file',f);
     fetch('/api/image-to-pdf',{method:'POST',body:fd,headers:{'Accept':'application/json'}})
       .then(r=>{ if(!r.ok) throw 0; return r.json(); })
-      .then(d=>{ S.converted[i]={ name:f.name.replace(/\.[^/.]+$/,'.pdf'), size:d.size, pixels:d.pixels, url:d.url }; })
+      .then(d=>{ S.converted[i]={ name:f.name.replace(/\.[^/.]+$/,'.pdf'), size:d.size, pixels:d.pixels, url:d.url, id:d.id }; })
       .catch(()=>{ S.converted[i]=null; })
       .finally(()=>{
         done++; const pct=Math.round((done/S.uploaded.length)*100); pf.style.width=pct+'%'; pt.textContent=pct+'%';
@@ -63,7 +63,10 @@ function render(){
 }
 function dl(url,name){ const a=document.createElement('a'); a.href=url; a.download=name; document.body.appendChild(a); a.click(); a.remove(); }
 zipBtn?.addEventListener('click', ()=>{
-  const files=S.converted.filter(Boolean).map(x=>x.url); if(!files.length) return;
-  fetch('/api/image-to-pdf-zip',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({files})})
-    .then(r=>r.blob()).then(b=>{ const a=document.createElement('a'); a.href=URL.createObjectURL(b); a.download='converted_pdfs.zip'; document.body.appendChild(a); a.click(); a.remove(); });
+  const ids=S.converted.filter(Boolean).map(x=>x.id); if(!ids.length) return;
+  fetch('/api/image-to-pdf-zip',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({ids})})
+    // Expired results come back as a 410 with a JSON error, not a ZIP
+    .then(r=>r.ok?r.blob():r.json().catch(()=>({})).then(e=>{ throw new Error(e.error||'Download failed'); }))
+    .then(b=>{ const a=document.createElement('a'); a.href=URL.createObjectURL(b); a.download='converted_pdfs.zip'; document.body.appendChild(a); a.click(); a.remove(); })
+    .catch(e=>alert('Error: '+e.message));
 });
\ No newline at end of file
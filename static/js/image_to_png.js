@@ -52,7 +52,7 @@ convertBtn?.addEventListener('click', ()=>{
     const fd=new FormData(); fd.append('file',f);
     fetch('/api/image-to-png',{method:'POST',body:fd,headers:{'Accept':'application/json'}})
       .then(r=>{ if(!r.ok) throw 0; return r.json(); })
-      .then(d=>{ statePNG.converted[i]={ name:f.name.replace(/\.[^/.]+$/,'.png'), size:d.size, pixels:d.pixels, url:d.url }; })
+      .then(d=>{ statePNG.converted[i]={ name:f.name.replace(/\.[^/.]+$/,'.png'), size:d.size, pixels:d.pixels, url:d.url, id:d.id }; })
       .catch(()=>{ statePNG.converted[i]=null; })
       .finally(()=>{
         done++; const pct=Math.round((done/statePNG.uploaded.length)*100);
@@ -89,8 +89,11 @@ function render(){
 }
 function download(url,name){ const a=document.createElement('a'); a.href=url; a.download=name; document.body.appendChild(a); a.click(); a.remove(); }
 dlZip?.addEventListener('click', ()=>{
-  const files = statePNG.converted.filter(Boolean).map(x=>x.url);
-  if(!files.length) return;
-  fetch('/api/image-to-png-zip',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({files})})
-    .then(r=>r.blob()).then(b=>{ const a=document.createElement('a'); a.href=URL.createObjectURL(b); a.download='converted_images.zip'; document.body.appendChild(a); a.click(); a.remove(); });
+  const ids = statePNG.converted.filter(Boolean).map(x=>x.id);
+  if(!ids.length) return;
+  fetch('/api/image-to-png-zip',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({ids})})
+    // Expired results come back as a 410 with a JSON error, not a ZIP
+    .then(r=>r.ok?r.blob():r.json().catch(()=>({})).then(e=>{ throw new Error(e.error||'Download failed'); }))
+    .then(b=>{ const a=document.createElement('a'); a.href=URL.createObjectURL(b); a.download='converted_images.zip'; document.body.appendChild(a); a.click(); a.remove(); })
+    .catch(e=>alert('Error: '+e.message));
 });
\ No newline at end of file
@@ -295,6 +295,7 @@ class ImageReducer {
     }
 
     displayResults(results) {
+        this.results = results;
         this.resultsContainer.innerHTML = '';
 
         results.forEach(result => {
@@ -357,8 +358,31 @@ class ImageReducer {
         return item;
     }
 
-    downloadAll() {
-        window.location.href = '/api/download-all';
+    async downloadAll() {
+        // download_url is /download/<result_id>/<filename>
+        const params = new URLSearchParams();
+        (this.results || []).forEach(result => {
+            if (result.download_url) {
+                params.append('file', decodeURIComponent(result.download_url.replace('/download/', '')));
+            }
+        });
+        const url = '/api/download-all?' + params.toString();
+        try {
+            // HEAD runs the expiry check without building the archive;
+            // expired results come back as a 410 instead of a ZIP
+            const response = await fetch(url, { method: 'HEAD' });
+            if (!response.ok) {
+                throw new Error(response.status === 410
+                    ? 'Some files have expired, please process them again'
+                    : 'Download failed');
+            }
+        } catch (error) {
+            alert('Error: ' + error.message);
+            return;
+        }
+        // A navigation (the response is an attachment) lets the browser
+        // stream the archive to disk as it is built
+        window.location.href = url;
     }
 
     showLoading(show) {
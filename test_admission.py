@@ -0,0 +1,58 @@
+"""Tests for header-only admission control"""
+
+import io
+
+import pytest
+from PIL import Image
+
+from services.admission import (
+    estimate, MemoryBudget, AdmissionRejected, WORKING_COPIES, TILED_WORKING_COPIES,
+)
+
+
+def _encoded(size, fmt):
+    buf = io.BytesIO()
+    Image.new('RGB', size).save(buf, fmt)
+    return buf.getvalue()
+
+
+def test_jpeg_is_costed_at_draft_scale():
+    data = _encoded((4000, 3000), 'JPEG')
+    full = estimate(data)
+    planned = estimate(data, plan=lambda img: (400, 300))
+    assert (full['width'], full['height']) == (4000, 3000)
+    assert planned['pixels'] == 1000 * 750
+    assert planned['cost'] < full['cost'] / 10
+
+
+def test_png_is_costed_at_full_size():
+    data = _encoded((2000, 1000), 'PNG')
+    assert estimate(data, plan=lambda img: (200, 100))['pixels'] == 2000 * 1000
+
+
+def test_large_images_get_the_strip_discount_only_when_resized(monkeypatch):
+    import services.tiled as tiled
+    monkeypatch.setattr(tiled, 'TILED_PIXELS', 1_000_000)
+    data = _encoded((2000, 1000), 'PNG')
+    plain = estimate(data)
+    resized = estimate(data, plan=lambda img: (200, 100))
+    same_size = estimate(data, plan=lambda img: (2000, 1000))
+    assert plain['cost'] == 2000 * 1000 * 3 * WORKING_COPIES
+    assert same_size['cost'] == plain['cost']
+    assert resized['cost'] == 2000 * 1000 * 3 * TILED_WORKING_COPIES
+
+
+def test_budget_queues_then_rejects():
+    budget = MemoryBudget(limit=100, wait=0.05)
+    with pytest.raises(AdmissionRejected) as never_fits:
+        with budget.reserve(101):
+            pass
+    assert never_fits.value.status == 413
+
+    with budget.reserve(80):
+        with pytest.raises(AdmissionRejected) as busy:
+            with budget.reserve(30):
+                pass
+    assert busy.value.status == 503
+    with budget.reserve(100):
+        assert budget.stats()['in_use_bytes'] == 100
@@ -7,7 +7,6 @@ import io
 import base64
 # from models import db
 # from auth import auth_bp
-from blueprints.image_to_jpg_api import bp as image_to_jpg_api_bp
 from blueprints.image_convert_api import bp as image_convert_bp
 
 # Create the single Flask application instance
@@ -17,7 +16,6 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB limit
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # Register blueprints AFTER creating `app`
-app.register_blueprint(image_to_jpg_api_bp)
 app.register_blueprint(image_convert_bp)
 
 @app.route('/')
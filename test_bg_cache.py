@@ -0,0 +1,34 @@
+"""Tests for the background-removal result cache"""
+
+from services.bg_cache import CutoutCache
+
+
+def test_key_depends_on_model_and_bytes():
+    assert CutoutCache.key(b'img', 'u2net') != CutoutCache.key(b'img', 'isnet-general-use')
+    assert CutoutCache.key(b'img', 'u2net') == CutoutCache.key(b'img', 'u2net')
+
+
+def test_memory_then_disk_tier(tmp_path):
+    cache = CutoutCache(memory_bytes=1024, disk_bytes=1024 * 1024, root=str(tmp_path))
+    key = CutoutCache.key(b'photo', 'u2net')
+
+    assert cache.get(key) is None
+    cache.put(key, b'png-bytes')
+    assert cache.get(key) == b'png-bytes'
+
+    # A fresh instance (another worker) only has the disk tier
+    other = CutoutCache(root=str(tmp_path))
+    assert other.get(key) == b'png-bytes'
+
+    assert cache.stats()['misses'] == 1
+    assert cache.stats()['memory_hits'] == 1
+    assert other.stats()['disk_hits'] == 1
+
+
+def test_disk_tier_is_trimmed_to_budget(tmp_path):
+    cache = CutoutCache(memory_bytes=0, disk_bytes=250, root=str(tmp_path))
+    for i in range(5):
+        cache.put(CutoutCache.key(str(i).encode(), 'u2net'), b'x' * 100)
+
+    on_disk = sum(p.stat().st_size for p in tmp_path.rglob('*.png'))
+    assert on_disk <= 250
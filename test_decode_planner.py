@@ -0,0 +1,40 @@
+"""Tests for the reduced-resolution decode planner and strip resizing"""
+
+import io
+
+from PIL import Image
+
+from services.decode_planner import fit_within, open_for_target, resize_to
+from services.tiled import resize_strips
+
+
+def _jpeg(size):
+    buf = io.BytesIO()
+    Image.new('RGB', size, (200, 40, 40)).save(buf, 'JPEG')
+    return buf.getvalue()
+
+
+def test_jpeg_decodes_at_reduced_scale():
+    img = open_for_target(Image.open(io.BytesIO(_jpeg((4000, 3000)))), (400, 300))
+    assert img.size == (1000, 750)  # 1/4 DCT scale, still >= 2x the target
+    assert resize_to(img, (400, 300)).size == (400, 300)
+
+
+def test_no_draft_when_not_shrinking():
+    img = open_for_target(Image.open(io.BytesIO(_jpeg((640, 480)))), (800, 600))
+    assert img.size == (640, 480)
+
+
+def test_fit_within_keeps_aspect():
+    assert fit_within((6000, 4000), max_width=800) == (800, 533)
+    assert fit_within((6000, 4000), max_width=800, max_height=300) == (450, 300)
+    assert fit_within((600, 400), max_width=800) == (600, 400)
+
+
+def test_strip_resize_matches_one_shot_resize():
+    img = Image.effect_noise((1200, 900), 64).convert('RGB')
+    whole = img.resize((500, 375), Image.Resampling.LANCZOS)
+    # A huge gap disables the integer reduce() so both paths are pure LANCZOS
+    strips = resize_strips(img, (500, 375), reducing_gap=100, strip_rows=64)
+    assert strips.size == whole.size
+    assert max(abs(a - b) for a, b in zip(whole.tobytes(), strips.tobytes())) <= 1
@@ -0,0 +1,107 @@
+"""Tests for the SQLite-backed job queue"""
+
+import time
+
+from services.jobs import JobQueue, handler, DONE, FAILED
+
+
+@handler('test-echo')
+def _echo(job):
+    names = []
+    for done, (name, data) in enumerate(job.inputs(), start=1):
+        names.append({'name': name, 'size': len(data)})
+        job.progress(done)
+    return names
+
+
+@handler('test-fail')
+def _fail(job):
+    raise RuntimeError('boom')
+
+
+def _wait(queue, job_id):
+    for _ in range(100):
+        job = queue.get(job_id)
+        if job['status'] in (DONE, FAILED):
+            return job
+        time.sleep(0.05)
+    raise AssertionError('job did not finish')
+
+
+def test_submit_runs_and_reports(tmp_path):
+    queue = JobQueue(db_path=str(tmp_path / 'jobs.db'), root=str(tmp_path / 'jobs'), workers=1)
+    job_id = queue.submit('test-echo', [('a.png', b'123'), ('b.png', b'45')])
+
+    job = _wait(queue, job_id)
+    assert job['status'] == DONE
+    assert job['progress'] == 1.0
+    assert job['results'] == [{'name': 'a.png', 'size': 3}, {'name': 'b.png', 'size': 2}]
+    assert not (tmp_path / 'jobs' / job_id).exists()
+
+
+def test_failures_and_expiry(tmp_path):
+    queue = JobQueue(db_path=str(tmp_path / 'jobs.db'), root=str(tmp_path / 'jobs'), workers=1, ttl=0)
+    job_id = queue.submit('test-fail', [('a.png', b'1')])
+
+    job = _wait(queue, job_id)
+    assert job['status'] == FAILED
+    assert job['error'] == 'boom'
+
+    queue.sweep()
+    assert queue.get(job_id) is None
+
+
+@handler('test-slow')
+def _slow(job):
+    # One long step with no progress() calls
+    time.sleep(1.5)
+    return []
+
+
+def test_heartbeat_keeps_long_steps_alive(tmp_path, monkeypatch):
+    import services.jobs as jobs
+    monkeypatch.setattr(jobs, 'JOB_STALE', 0.6)
+    queue = JobQueue(db_path=str(tmp_path / 'jobs.db'), root=str(tmp_path / 'jobs'), workers=1)
+    job_id = queue.submit('test-slow', [('a.png', b'1')])
+
+    time.sleep(1.0)
+    queue.sweep()  # past JOB_STALE since the claim, but the heartbeat ran
+    assert queue.get(job_id)['status'] == jobs.RUNNING
+
+    job = _wait(queue, job_id)
+    assert job['status'] == DONE
+
+
+@handler('test-unserializable')
+def _unserializable(job):
+    return [object()]
+
+
+def test_unrecordable_results_fail_the_job(tmp_path):
+    queue = JobQueue(db_path=str(tmp_path / 'jobs.db'), root=str(tmp_path / 'jobs'), workers=1)
+    job_id = queue.submit('test-unserializable', [('a.png', b'1')])
+
+    job = _wait(queue, job_id)
+    assert job['status'] == FAILED
+    assert job['error'].startswith('Could not record results')
+
+
+def test_finish_errors_dont_stop_the_job_thread(tmp_path, monkeypatch):
+    import services.jobs as jobs
+    queue = JobQueue(db_path=str(tmp_path / 'jobs.db'), root=str(tmp_path / 'jobs'), workers=1)
+    calls = []
+    real_finish = queue._finish
+
+    def flaky_finish(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise RuntimeError('disk gone')
+        return real_finish(*args, **kwargs)
+
+    monkeypatch.setattr(queue, '_finish', flaky_finish)
+    first = queue.submit('test-echo', [('a.png', b'1')])
+    second = queue.submit('test-echo', [('b.png', b'22')])
+
+    # The first job's finish blew up, yet the same thread runs the next one
+    assert _wait(queue, second)['status'] == DONE
+    assert queue.get(first)['status'] == jobs.RUNNING
@@ -0,0 +1,24 @@
+"""Tests for the per-key token buckets"""
+
+from services.rate_limit import MemoryBuckets, SharedBuckets
+
+
+def _exercise(buckets):
+    now = 1000.0
+    # 3/minute: a burst of three, then one token every 20 s
+    assert [buckets.take('key', 3, now=now)[0] for _ in range(4)] == [True, True, True, False]
+    allowed, _, wait = buckets.take('key', 3, now=now)
+    assert not allowed and round(wait) == 20
+    assert buckets.take('key', 3, now=now + 20)[0]
+    assert buckets.take('other', 3, now=now)[0]
+
+
+def test_memory_buckets():
+    _exercise(MemoryBuckets())
+
+
+def test_shared_buckets_survive_reopen(tmp_path):
+    path = str(tmp_path / 'ratelimit.bin')
+    _exercise(SharedBuckets(path=path, slots=64))
+    # Another worker mapping the same file sees the drained bucket
+    assert not SharedBuckets(path=path, slots=64).take('key', 3, now=1020.0)[0]
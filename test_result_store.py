@@ -0,0 +1,59 @@
+"""Tests for the bounded result store"""
+
+import os
+import time
+
+from services.result_store import ResultStore
+
+
+def test_lru_eviction_keeps_budget(tmp_path):
+    store = ResultStore(max_bytes=10, ttl=60, root=str(tmp_path))
+    first = store.put(b'aaaaaa', 'a.bin')
+    second = store.put(b'bbbbbb', 'b.bin')
+
+    assert store.get(first) is None
+    assert store.get(second) == b'bbbbbb'
+    assert store.stats()['bytes'] <= 10
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_persisted_results_survive_eviction(tmp_path):
+    store = ResultStore(max_bytes=4, ttl=60, root=str(tmp_path))
+    key = store.put(b'persisted', 'p.bin', persist=True)
+    store.put(b'other-bytes', 'o.bin')
+
+    # Gone from memory, still served from the disk copy
+    assert store.get(key) == b'persisted'
+    assert ResultStore(root=str(tmp_path)).get(key) == b'persisted'
+
+
+def test_rejects_malformed_keys(tmp_path):
+    store = ResultStore(root=str(tmp_path))
+    assert store.get('../../etc/passwd') is None
+    assert store.get('') is None
+
+
+def test_disk_copies_trimmed_oldest_first(tmp_path):
+    store = ResultStore(max_bytes=1000, ttl=60, root=str(tmp_path), disk_bytes=20)
+    keys = []
+    for i in range(4):
+        keys.append(store.put(b'x' * 8, f'{i}.bin', persist=True))
+        # Distinct mtimes so "oldest" is well defined
+        past = time.time() - 10 + i
+        os.utime(tmp_path / keys[-1], (past, past))
+
+    on_disk = {p.name for p in tmp_path.iterdir()}
+    assert keys[0] not in on_disk
+    assert keys[-1] in on_disk
+    assert sum(p.stat().st_size for p in tmp_path.iterdir()) <= 20
+
+
+def test_sweep_removes_expired_copies(tmp_path):
+    store = ResultStore(ttl=60, root=str(tmp_path))
+    key = store.put(b'old', 'o.bin', persist=True)
+    past = time.time() - 120
+    os.utime(tmp_path / key, (past, past))
+
+    # A fresh worker sweeps on its first get()
+    assert ResultStore(ttl=60, root=str(tmp_path)).get('x' * 22) is None
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,62 @@
+"""Tests for the in-memory target-size encoder"""
+
+import io
+import random
+
+from PIL import Image
+
+from services.target_size import fit_to_size, search_quality, encode
+
+
+def noisy_image(size=(400, 300), mode='RGB'):
+    rnd = random.Random(42)
+    img = Image.new(mode, size)
+    img.putdata([tuple(rnd.randrange(256) for _ in mode) for _ in range(size[0] * size[1])])
+    return img
+
+
+def test_jpeg_fits_budget_with_largest_quality():
+    img = noisy_image()
+    target = 40 * 1024
+    result = fit_to_size(img, 'JPEG', target)
+
+    assert result['fits']
+    assert len(result['data']) <= target
+    assert result['width'] == img.width
+    # One step up in quality must overshoot, otherwise we didn't pick the largest
+    if result['quality'] < 100:
+        assert len(encode(img, 'JPEG', quality=result['quality'] + 1)) > target
+
+
+def test_search_quality_uses_few_encodes(monkeypatch):
+    import services.target_size as target_size
+    calls = []
+    real_encode = target_size.encode
+
+    def counting_encode(*args, **kwargs):
+        calls.append(kwargs.get('quality'))
+        return real_encode(*args, **kwargs)
+
+    monkeypatch.setattr(target_size, 'encode', counting_encode)
+    search_quality(noisy_image(), 'JPEG', 30 * 1024)
+    assert len(calls) <= 10
+
+
+def test_falls_back_to_scaling_when_quality_is_not_enough():
+    img = noisy_image((800, 600))
+    target = 8 * 1024
+    result = fit_to_size(img, 'JPEG', target)
+
+    assert result['fits']
+    assert len(result['data']) <= target
+    assert result['width'] < img.width
+    decoded = Image.open(io.BytesIO(result['data']))
+    assert decoded.size == (result['width'], result['height'])
+
+
+def test_png_scales_down_and_rgba_jpeg_is_converted():
+    png = fit_to_size(noisy_image((300, 300), 'RGBA'), 'PNG', 60 * 1024)
+    assert png['fits'] and len(png['data']) <= 60 * 1024
+
+    jpeg = fit_to_size(noisy_image((200, 200), 'RGBA'), 'JPEG', 20 * 1024)
+    assert Image.open(io.BytesIO(jpeg['data'])).mode == 'RGB'
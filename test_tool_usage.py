@@ -0,0 +1,31 @@
+"""Tests for the buffered tool usage counters and their report"""
+
+from datetime import datetime, timedelta
+
+from services.tool_usage import ToolUsageCounter, init_usage_db, compact, tool_report
+
+
+def test_flush_and_report(tmp_path):
+    db_path = str(tmp_path / 'usage.db')
+    init_usage_db(db_path)
+    counter = ToolUsageCounter(db_path, flush_seconds=3600)
+    for _ in range(10):
+        counter.hit('/word-counter')
+    for ms in range(1, 101):
+        counter.timing('/api/convert', ms / 1000.0)
+    counter.close()
+
+    today = datetime.utcnow().strftime('%Y-%m-%d')
+    tools = {t['path']: t for t in tool_report(today, today, 'hour', db_path=db_path)}
+    assert tools['/word-counter']['hits'] == 10
+    assert len(tools['/word-counter']['series']) == 1
+    latency = tools['/api/convert']['latency_ms']
+    # Bins are ~20% wide and report their upper bound
+    assert 50 <= latency['p50'] <= 60
+    assert 99 <= latency['p99'] <= 120
+
+    # Compacting well into the future folds today's hours into one day row
+    compact(db_path, now=datetime.utcnow() + timedelta(days=30))
+    tools = {t['path']: t for t in tool_report(today, today, 'hour', db_path=db_path)}
+    assert tools['/word-counter']['series'] == [{'bucket': today, 'hits': 10}]
+    assert tools['/api/convert']['timed'] == 100
@@ -0,0 +1,74 @@
+"""Tests for folding api_usage rows into rollup buckets"""
+
+from datetime import datetime
+
+from models_api import APIUsageHourly, APIUsageDaily
+from services.usage_rollup import bucket_deltas
+
+
+def _row(minute, hour=10, status='success', seconds=0.5):
+    return {
+        'api_key_id': 'k', 'endpoint': '/api/convert', 'status': status, 'model_used': None,
+        'processing_time': seconds, 'created_at': datetime(2024, 1, 1, hour, minute),
+    }
+
+
+def test_bucket_deltas():
+    rows = [_row(5), _row(50, seconds=None), _row(5, hour=11), _row(6, status='error')]
+    deltas = bucket_deltas(rows)
+
+    hourly = {(b['bucket_start'].hour, b['status']): b for b in deltas[APIUsageHourly]}
+    assert hourly[(10, 'success')]['requests'] == 2
+    assert hourly[(10, 'success')]['time_sum'] == 0.5  # None counts as 0
+    assert hourly[(11, 'success')]['requests'] == 1
+    assert hourly[(10, 'error')]['requests'] == 1
+
+    daily = {b['status']: b for b in deltas[APIUsageDaily]}
+    assert daily['success']['requests'] == 3
+    assert daily['success']['bucket_start'] == datetime(2024, 1, 1)
+    assert daily['success']['model_used'] == ''
+
+
+def _rollup_app(tmp_path):
+    from flask import Flask
+    from models_api import db
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'rollup.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app, db
+
+
+def test_compact_marks_complete_without_history(tmp_path):
+    from services import usage_rollup
+
+    app, db = _rollup_app(tmp_path)
+    with app.app_context():
+        usage_rollup.start(db.engine)
+        coverage = usage_rollup._Coverage()
+        assert not coverage.covers(datetime.min)
+
+        # Empty api_usage: nothing to fold, yet the buckets are complete
+        result = usage_rollup.compact(db.engine, log=lambda msg: None)
+        assert result['folded'] == 0
+        assert coverage.covers(datetime.min)
+
+
+def test_compact_with_only_newer_rows(tmp_path):
+    from datetime import timedelta
+    from models_api import APIUsage
+    from services import usage_rollup
+
+    app, db = _rollup_app(tmp_path)
+    with app.app_context():
+        usage_rollup.start(db.engine)
+        # A row the writer logged days after rollups started
+        with db.engine.begin() as conn:
+            conn.execute(APIUsage.__table__.insert(), [{
+                'id': 'r1', 'api_key_id': 'k', 'endpoint': '/x', 'status': 'success',
+                'created_at': datetime.utcnow() + timedelta(days=3),
+            }])
+        assert usage_rollup.compact(db.engine, log=lambda msg: None)['folded'] == 0
+        assert usage_rollup._Coverage().covers(datetime.min)
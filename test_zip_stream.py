@@ -0,0 +1,35 @@
+"""Tests for the streaming ZIP writer"""
+
+import io
+import os
+import zipfile
+
+from services.zip_stream import iter_zip, CHUNK_SIZE
+
+
+def test_roundtrip_bytes_and_paths(tmp_path):
+    on_disk = tmp_path / 'notes.txt'
+    on_disk.write_bytes(b'hello ' * 1000)
+    photo = os.urandom(3 * CHUNK_SIZE + 17)
+
+    archive = b''.join(iter_zip([('photo.jpg', photo), ('notes.txt', str(on_disk))]))
+
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        assert zf.testzip() is None
+        assert zf.read('photo.jpg') == photo
+        assert zf.read('notes.txt') == b'hello ' * 1000
+        assert zf.getinfo('photo.jpg').compress_type == zipfile.ZIP_STORED
+        assert zf.getinfo('notes.txt').compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_streams_before_later_members_are_read():
+    touched = []
+
+    def members():
+        for i in range(3):
+            touched.append(i)
+            yield f'file_{i}.png', os.urandom(2 * CHUNK_SIZE)
+
+    stream = iter_zip(members())
+    next(stream)
+    assert touched == [0]